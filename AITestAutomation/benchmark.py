@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+import tracemalloc
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from playwright._impl._connection import Connection
+
+
+BENCHMARK_APP_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_app")
+BENCHMARK_ACCOUNT = "benchmark@example.com"
+BENCHMARK_RESULTS_FILE = "benchmark_results.json"
+
+# Number of Playwright protocol messages sent to the browser driver so far, each is roughly one CDP round-trip
+protocol_calls = 0
+
+# Metrics compared against the baseline, a run regresses when one of them grows by more than the tolerance
+COMPARED_METRICS = ["wall_seconds", "protocol_calls", "prompt_tokens", "completion_tokens", "peak_memory_kb"]
+
+
+# Request handler of the stand-in application: the static pages plus an owners API that answers after the configured latency
+class BenchmarkAppHandler(SimpleHTTPRequestHandler):
+    latency_seconds = 0.05
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.latency_seconds)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"status": "ok"}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to serve the stand-in application on a free local port from a background thread
+def start_benchmark_app(latency_ms=50):
+    BenchmarkAppHandler.latency_seconds = latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(BenchmarkAppHandler, directory=BENCHMARK_APP_DIRECTORY))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+
+# Chat model stand-in for the agent: it calls the given actions in order, one per step, and then reports the collected test cases with "done".
+# Its token counts are estimated from the prompt size (4 characters per token), so that prompt growth shows up in the benchmark
+class StubChatModel(BaseChatModel):
+    action_names: List[str]
+    model_name: str = "benchmark-stub"
+    test_cases: List[dict] = []
+    step: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-stub"
+
+    # The structured output of the agent is requested through a tool, the stub always answers with a call to it
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+
+        # BrowserUse checks the connection to the model with a sanity question before the run
+        if "capital of France" in str(messages[-1].content):
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="Paris"))])
+
+        if self.step < len(self.action_names):
+            action = {self.action_names[self.step]: {}}
+            next_goal = f"Run {self.action_names[self.step]}"
+        else:
+            action = {"done": {"success": True, "data": {"test_cases": self.test_cases}}}
+            next_goal = "Report the results"
+        self.step += 1
+
+        args = {
+            "current_state": {"evaluation_previous_goal": "Success", "memory": f"Step {self.step}", "next_goal": next_goal},
+            "action": [action]
+        }
+        completion_tokens = len(json.dumps(args)) // 4
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+        message = AIMessage(
+            content="",
+            tool_calls=[{"name": "AgentOutput", "args": args, "id": f"call_{self.step}"}],
+            usage_metadata={"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+# Function to count every Playwright protocol message, patching the connection once before the browser is started
+def instrument_protocol_calls():
+    send_message_to_server = Connection._send_message_to_server
+
+    def counting_send_message_to_server(connection, *args, **kwargs):
+        global protocol_calls
+        protocol_calls += 1
+        return send_message_to_server(connection, *args, **kwargs)
+
+    Connection._send_message_to_server = counting_send_message_to_server
+
+
+# Class to record the wall time, Playwright protocol calls, tokens and peak Python memory of each stage and test case
+class BenchmarkRecorder:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.llm = None
+        self.measurements = []
+
+    # Take a snapshot of the counters at the start of a stage
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        return {
+            "time": time.perf_counter(),
+            "protocol_calls": protocol_calls,
+            "prompt_tokens": self.llm.prompt_tokens if self.llm else 0,
+            "completion_tokens": self.llm.completion_tokens if self.llm else 0
+        }
+
+    # Record the difference of the counters since the snapshot
+    def record(self, stage, test_case, snapshot):
+        self.measurements.append({
+            "stage": stage,
+            "test_case": test_case,
+            "wall_seconds": time.perf_counter() - snapshot["time"],
+            "protocol_calls": protocol_calls - snapshot["protocol_calls"],
+            "prompt_tokens": (self.llm.prompt_tokens if self.llm else 0) - snapshot["prompt_tokens"],
+            "completion_tokens": (self.llm.completion_tokens if self.llm else 0) - snapshot["completion_tokens"],
+            "peak_memory_kb": tracemalloc.get_traced_memory()[1] // 1024 if self.trace_memory else 0
+        })
+
+
+# Function to open a fresh headless browser and context for one benchmark stage
+async def open_benchmark_browser(test_automation, headless=True):
+    browser = test_automation.Browser(config=test_automation.BrowserConfig(headless=headless, disable_security=True))
+    browser_context = test_automation.BrowserContext(browser=browser, config=browser.config.new_context_config)
+    await browser_context.get_session()
+    return browser, browser_context
+
+
+# Function to benchmark the fallback actions run directly, one measurement per test case
+async def benchmark_deterministic(test_automation, recorder, headless=True):
+    snapshot = recorder.start()
+    browser, browser_context = await open_benchmark_browser(test_automation, headless)
+    recorder.record("browser_start", None, snapshot)
+
+    try:
+        for action in test_automation.get_fallback_actions():
+            snapshot = recorder.start()
+            action_result = await test_automation.controller.registry.execute_action(action.name, {}, browser=browser_context)
+            recorder.record("deterministic", action.name, snapshot)
+
+            outcome = test_automation.parse_action_result(action_result)
+            if not outcome or outcome[1] != "Passed":
+                print(f"Warning: {action.name} did not pass against the stand-in application: {outcome}")
+    finally:
+        await browser_context.close()
+        await browser.close()
+
+
+# Function to benchmark the BrowserUse agent driven by the stub chat model, one measurement per agent step
+async def benchmark_agent(test_automation, recorder, headless=True):
+    action_names = [action.name for action in test_automation.get_fallback_actions()]
+    llm = StubChatModel(action_names=action_names)
+    recorder.llm = llm
+
+    snapshot = recorder.start()
+    browser, browser_context = await open_benchmark_browser(test_automation, headless)
+    recorder.record("browser_start", None, snapshot)
+
+    try:
+        agent = test_automation.Agent(
+            task=test_automation.build_agent_task(),
+            llm=llm,
+            browser=browser,
+            browser_context=browser_context,
+            controller=test_automation.controller,
+            tool_calling_method="function_calling"
+        )
+
+        # The step hook closes the measurement of each step and collects the outcomes for the stub's final report
+        step_snapshot = recorder.start()
+
+        async def on_step_end(agent):
+            nonlocal step_snapshot
+            last_step = agent.state.history.history[-1]
+            for action_result in last_step.result:
+                outcome = test_automation.parse_action_result(action_result)
+                if outcome:
+                    llm.test_cases.append(test_automation.build_test_case(outcome).model_dump())
+            action_name = next(iter(last_step.model_output.action[0].model_dump(exclude_unset=True)), None) if last_step.model_output else None
+            recorder.record("agent", action_name, step_snapshot)
+            step_snapshot = recorder.start()
+
+        snapshot = recorder.start()
+        history = await agent.run(on_step_end=on_step_end, max_steps=len(action_names) + 2)
+        recorder.record("agent_total", None, snapshot)
+        if not history.is_done():
+            print("Warning: the agent did not finish against the stand-in application.")
+    finally:
+        await browser_context.close()
+        await browser.close()
+
+
+# Function to reduce the measurements of several runs to the median of each metric per stage and test case
+def summarize_measurements(runs):
+    grouped_measurements = {}
+    for measurements in runs:
+        for measurement in measurements:
+            grouped_measurements.setdefault((measurement["stage"], measurement["test_case"]), []).append(measurement)
+
+    return [
+        {"stage": stage, "test_case": test_case, **{metric: statistics.median(m[metric] for m in measurements) for metric in COMPARED_METRICS}}
+        for (stage, test_case), measurements in grouped_measurements.items()
+    ]
+
+
+# Function to compare the summary with a baseline, returning the metrics that grew by more than the tolerance
+def find_regressions(summary, baseline, tolerance):
+    baseline_measurements = {(m["stage"], m["test_case"]): m for m in baseline}
+    regressions = []
+    for measurement in summary:
+        baseline_measurement = baseline_measurements.get((measurement["stage"], measurement["test_case"]))
+        if not baseline_measurement:
+            continue
+        for metric in COMPARED_METRICS:
+            # Small absolute values are noise, e.g. a few milliseconds or kilobytes
+            if measurement[metric] > baseline_measurement[metric] * (1 + tolerance) and measurement[metric] - baseline_measurement[metric] > 1:
+                regressions.append((measurement["stage"], measurement["test_case"], metric, baseline_measurement[metric], measurement[metric]))
+    return regressions
+
+
+# Function to print the summary as a table, one row per stage and test case
+def print_summary(summary):
+    print(f"{'Stage':<14} {'Test case':<28} {'Wall (s)':>9} {'Calls':>7} {'Prompt tok':>11} {'Compl tok':>10} {'Peak KB':>9}")
+    for m in summary:
+        print(f"{m['stage']:<14} {str(m['test_case'] or '-'):<28} {m['wall_seconds']:>9.3f} {m['protocol_calls']:>7.0f} "
+              f"{m['prompt_tokens']:>11.0f} {m['completion_tokens']:>10.0f} {m['peak_memory_kb']:>9.0f}")
+
+
+async def run_benchmark(args):
+    server, app_url = start_benchmark_app(args.latency_ms)
+    app_url = f"{app_url}?rows={args.rows}&accounts={BENCHMARK_ACCOUNT}"
+
+    # test_automation reads its settings when it is imported, so they point at the stand-in application and stub model first
+    os.environ.update({
+        "APP_URL": app_url,
+        "LOGIN_ACCOUNT": BENCHMARK_ACCOUNT,
+        "ANONYMIZED_TELEMETRY": "false",
+        "AUTH_STATE_KEY": ""
+    })
+    for key in ["AZURE_OPENAI_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_VERSION", "AZURE_OPENAI_MODEL"]:
+        os.environ.setdefault(key, "benchmark")
+    import test_automation
+
+    instrument_protocol_calls()
+    if args.trace_memory:
+        tracemalloc.start()
+
+    runs = []
+    try:
+        for run in range(args.runs):
+            print(f"Benchmark run {run + 1}/{args.runs}...")
+            recorder = BenchmarkRecorder(trace_memory=args.trace_memory)
+            if args.mode in ("all", "deterministic"):
+                await benchmark_deterministic(test_automation, recorder, not args.headed)
+            if args.mode in ("all", "agent"):
+                await benchmark_agent(test_automation, recorder, not args.headed)
+            runs.append(recorder.measurements)
+    finally:
+        server.shutdown()
+
+    return summarize_measurements(runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the executor against a local stand-in application and a stub chat model.")
+    parser.add_argument("--mode", choices=["all", "deterministic", "agent"], default="all")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs, the median of each metric is reported.")
+    parser.add_argument("--rows", type=int, default=50, help="Number of rows in the queue table of the stand-in application.")
+    parser.add_argument("--latency-ms", type=int, default=50, help="Latency of the stand-in application's owners API.")
+    parser.add_argument("--headed", action="store_true", help="Show the browser instead of running it headless.")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false", help="Skip the Python memory tracing, which slows down the run.")
+    parser.add_argument("--output", default=BENCHMARK_RESULTS_FILE, help="File to save the summary to.")
+    parser.add_argument("--baseline", help="Summary of an earlier run to compare with, the benchmark fails on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative growth of a metric over the baseline that counts as a regression.")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_benchmark(args))
+    print_summary(summary)
+    with open(args.output, "w") as file:
+        json.dump(summary, file, indent=4)
+    print(f"Benchmark results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = find_regressions(summary, json.load(file), args.tolerance)
+        for stage, test_case, metric, baseline_value, value in regressions:
+            print(f"Regression in {stage} / {test_case or '-'}: {metric} went from {baseline_value:g} to {value:g}")
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions against the baseline.")
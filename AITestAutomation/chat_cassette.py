@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+DEFAULT_CASSETTE_FILE = "chat_cassette.json"
+CASSETTE_MODES = ["record", "replay", "replay-or-record"]
+
+# BrowserUse puts the current time into every state message, it is left out of the key so that a rerun matches the recording
+VOLATILE_CONTENT_PATTERN = re.compile(r"Current date and time: \d{4}-\d{2}-\d{2} \d{2}:\d{2}")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+# Function to normalise a chat message for its key: screenshots and the current time are left out, whitespace is collapsed and tool call ids are dropped
+def normalize_message(message):
+    content = message.content
+    if isinstance(content, list):
+        content = " ".join(part.get("text", f"<{part.get('type')}>") if isinstance(part, dict) else str(part) for part in content)
+    content = WHITESPACE_PATTERN.sub(" ", VOLATILE_CONTENT_PATTERN.sub("", str(content))).strip()
+
+    normalized_message = {"type": message.type, "content": content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        normalized_message["tool_calls"] = [{"name": tool_call["name"], "args": tool_call["args"]} for tool_call in tool_calls]
+    return normalized_message
+
+
+# Function to build the key of a chat request from its normalised messages and the tools bound to the model
+def build_request_key(messages, tools_key=""):
+    request = {"tools": tools_key, "messages": [normalize_message(message) for message in messages]}
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Class to hold the recorded responses of a cassette file, a request that is made more than once replays its responses in recorded order
+class Cassette:
+    def __init__(self, filename, mode):
+        self.filename = filename
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.replay_positions = {}
+        self.entries = {}
+
+        # Recording starts a new cassette, the other modes replay the saved one
+        if mode != "record" and os.path.exists(filename):
+            with open(filename, "r") as file:
+                self.entries = json.load(file)
+            print(f"Loaded {sum(len(responses) for responses in self.entries.values())} recorded chat responses from {filename}")
+
+    # Get the next recorded response of a request, None when it was not recorded or all its responses were replayed
+    def next_response(self, request_key):
+        with self.lock:
+            responses = self.entries.get(request_key, [])
+            position = self.replay_positions.get(request_key, 0)
+            if position >= len(responses):
+                return None
+            self.replay_positions[request_key] = position + 1
+            return messages_from_dict([responses[position]])[0]
+
+    # Record the response of a request and save the cassette, so that an interrupted run keeps what it recorded
+    def record(self, request_key, message):
+        with self.lock:
+            responses = self.entries.setdefault(request_key, [])
+            responses.append(message_to_dict(message))
+            self.replay_positions[request_key] = len(responses)
+
+            # Write to a temporary file first so that an interrupted run never leaves a truncated cassette behind
+            with open(f"{self.filename}.tmp", "w") as file:
+                json.dump(self.entries, file)
+            os.replace(f"{self.filename}.tmp", self.filename)
+
+
+# Chat model that records the requests and responses of the wrapped chat model into a cassette and replays them offline,
+# in "record" mode every request goes to the model, in "replay" mode none does, and in "replay-or-record" only the requests without a recording
+class CassetteChatModel(BaseChatModel):
+    chat_model: Any = None
+    cassette: Any
+    model_name: str = "cassette"
+    tools_key: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    # The tools are bound to the wrapped model, and their schemas become part of the request key
+    def bind_tools(self, tools, **kwargs):
+        tools_key = json.dumps([convert_to_openai_tool(tool) for tool in tools], sort_keys=True)
+        chat_model = self.chat_model.bind_tools(tools, **kwargs) if self.chat_model else None
+        return self.model_copy(update={"chat_model": chat_model, "tools_key": tools_key})
+
+    # Get the recorded response of the request, None when the request has to go to the wrapped model
+    def _replay(self, request_key):
+        if self.cassette.mode == "record":
+            return None
+        message = self.cassette.next_response(request_key)
+        if message is None and self.cassette.mode == "replay":
+            raise ValueError(f"No recorded response for this chat request in {self.cassette.filename}, record it with CHAT_CASSETTE_MODE=replay-or-record.")
+        return message
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        request_key = build_request_key(messages, self.tools_key)
+        message = self._replay(request_key)
+        if message is None:
+            message = self.chat_model.invoke(messages, stop=stop, **kwargs)
+            self.cassette.record(request_key, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        request_key = build_request_key(messages, self.tools_key)
+        message = self._replay(request_key)
+        if message is None:
+            message = await self.chat_model.ainvoke(messages, stop=stop, **kwargs)
+            self.cassette.record(request_key, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+# Function to create the chat model of the executor, wrapped in a cassette when CHAT_CASSETTE_MODE is set.
+# The model is created by the given function, which is not called in "replay" mode, so that a replay needs no Azure settings or network
+def create_chat_model(create_model):
+    mode = os.environ.get("CHAT_CASSETTE_MODE")
+    if not mode:
+        return create_model()
+    if mode not in CASSETTE_MODES:
+        raise ValueError(f"Unknown chat cassette mode '{mode}', expected one of {', '.join(CASSETTE_MODES)}.")
+
+    cassette = Cassette(os.environ.get("CHAT_CASSETTE_FILE") or DEFAULT_CASSETTE_FILE, mode)
+    chat_model = create_model() if mode != "replay" else None
+    print(f"Chat model cassette {cassette.filename} in {mode} mode.")
+    return CassetteChatModel(
+        chat_model=chat_model,
+        cassette=cassette,
+        model_name=getattr(chat_model, "model_name", None) or os.environ.get("AZURE_OPENAI_MODEL") or "cassette"
+    )
@@ -0,0 +1,73 @@
+import json
+import asyncio
+import logging
+import subprocess
+import time
+import requests
+
+
+# Function to poll the Chrome DevTools endpoint with exponential backoff until Chrome answers or the time budget runs out
+async def wait_for_chrome(chrome_debug_port, timeout_seconds=30, initial_delay=0.05, max_delay=1.0):
+    devtools_url = f'http://localhost:{chrome_debug_port}/json/version'
+    start_time = time.monotonic()
+    delay = initial_delay
+
+    while True:
+        try:
+            response = await asyncio.to_thread(requests.get, devtools_url, timeout=max_delay)
+            if response.status_code == 200:
+                return time.monotonic() - start_time     # Launch latency in seconds
+        except requests.RequestException:
+            pass                                         # Chrome is not listening yet
+
+        if time.monotonic() - start_time + delay > timeout_seconds:
+            raise TimeoutError(f"Chrome did not respond on {devtools_url} within {timeout_seconds} seconds.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+# Function to start Chrome in debugging mode and return as soon as its DevTools endpoint is ready
+async def launch_chrome(chrome_path, chrome_debug_port, user_data_dir, timeout_seconds=30):
+    chrome_process = subprocess.Popen([chrome_path, f'--remote-debugging-port={chrome_debug_port}', f'--user-data-dir={user_data_dir}'])
+
+    try:
+        launch_latency = await wait_for_chrome(chrome_debug_port, timeout_seconds)
+    except BaseException:
+        # Stop a Chrome that never answered (or a launch that was cancelled), so that no orphaned Chrome keeps holding the port and profile
+        chrome_process.terminate()
+        try:
+            await asyncio.to_thread(chrome_process.wait, 5)
+        except subprocess.TimeoutExpired:
+            chrome_process.kill()
+        raise
+    logging.info(f"Chrome launch latency on port {chrome_debug_port}: {launch_latency:.3f} seconds.")
+    print(f"Chrome is running and accessible after {launch_latency:.2f} seconds.")
+
+    return chrome_process, launch_latency
+
+
+# Function to lease a warm Chrome instance from the browser pool daemon, the lease lasts as long as the connection stays open
+async def acquire_pooled_chrome(pool_address):
+    host, port = pool_address.rsplit(":", 1)
+    reader, writer = await asyncio.open_connection(host, int(port))
+    writer.write((json.dumps({"command": "acquire"}) + "\n").encode())
+    await writer.drain()
+
+    lease = json.loads(await reader.readline())
+    if "error" in lease:
+        writer.close()
+        raise RuntimeError(f"Failed to lease a Chrome instance from the browser pool: {lease['error']}")
+
+    lease["connection"] = writer
+    print(f"Leased warm Chrome instance {lease['cdp_url']} from the browser pool.")
+    return lease
+
+
+# Function to hand a leased Chrome instance back to the browser pool daemon
+async def release_pooled_chrome(lease):
+    writer = lease["connection"]
+    try:
+        writer.write((json.dumps({"command": "release", "lease_id": lease["lease_id"]}) + "\n").encode())
+        await writer.drain()
+    finally:
+        writer.close()
@@ -0,0 +1,133 @@
+import os
+import gzip
+import json
+import argparse
+from collections import deque
+
+# zstandard is optional, gzip is used when it is not installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_KEEP_LAST_STEPS = 5
+DEFAULT_COMPRESSION = "gzip"
+COMPRESSION_EXTENSIONS = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+
+# Function to open a history file for reading or writing in text mode, with the compression given by its extension
+def open_history_file(filename, mode="rt"):
+    if filename.endswith(".zst"):
+        if not zstandard:
+            raise ImportError(f"zstandard is required to open {filename}, install it with `pip install zstandard`.")
+        return zstandard.open(filename, mode, encoding="utf-8")
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode, encoding="utf-8")
+    return open(filename, mode, encoding="utf-8")
+
+
+# Function to dump a history step without its screenshot and DOM payload, keeping the URL, actions, results and the attributes and selectors
+# of the interacted elements (what the replay compiler needs). The agent's own history item is left as it is for the later consumers of the run
+def trim_history_step(history_item):
+    step = history_item.model_dump()
+    step["state"]["screenshot"] = None
+    for element in step["state"].get("interacted_element") or []:
+        if element:
+            element["entire_parent_branch_path"] = []
+            element["page_coordinates"] = None
+            element["viewport_coordinates"] = None
+            element["viewport_info"] = None
+    return step
+
+
+# Class to persist an agent history as compressed JSON lines, one step per line, keeping the full payload of the last steps only
+class AgentHistoryWriter:
+    def __init__(self, filename_base, keep_last_steps=None, compression=None, stream=None):
+        self.keep_last_steps = int(keep_last_steps if keep_last_steps is not None else os.environ.get("AGENT_HISTORY_KEEP_STEPS") or DEFAULT_KEEP_LAST_STEPS)
+        self.stream = stream if stream is not None else os.environ.get("AGENT_HISTORY_STREAM", "").lower() in ("1", "true", "yes")
+
+        compression = compression or os.environ.get("AGENT_HISTORY_COMPRESSION") or DEFAULT_COMPRESSION
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Unknown history compression '{compression}', expected one of {', '.join(COMPRESSION_EXTENSIONS)}.")
+        if compression == "zstd" and not zstandard:
+            print("zstandard is not installed, the agent history is compressed with gzip instead.")
+            compression = "gzip"
+        self.filename = f"{filename_base}.jsonl{COMPRESSION_EXTENSIONS[compression]}"
+
+        self.file = None
+        self.step_count = 0
+        self.recent_steps = deque()
+        self.trimmed_steps = []
+
+    # Add the next step of the run, trimming a copy of the step that falls out of the retained window
+    def add_step(self, history_item):
+        self.step_count += 1
+        self.recent_steps.append(history_item)
+        while len(self.recent_steps) > self.keep_last_steps:
+            trimmed_step = trim_history_step(self.recent_steps.popleft())
+
+            # When streaming, the trimmed step is final and goes to disk right away, otherwise it is written with the rest at the end
+            if self.stream:
+                self.write_step(trimmed_step)
+            else:
+                self.trimmed_steps.append(trimmed_step)
+
+    # Append one step, a history item or an already dumped step, to the history file, flushed so that a crash keeps the steps streamed before it
+    def write_step(self, step):
+        if not self.file:
+            self.file = open_history_file(self.filename, "wt")
+        self.file.write(json.dumps(step if isinstance(step, dict) else step.model_dump()) + "\n")
+        self.file.flush()
+
+    # Add the steps of the finished run that were not added yet, and write the remaining steps to the history file
+    def finish(self, history=None):
+        for history_item in (history.history[self.step_count:] if history else []):
+            self.add_step(history_item)
+        for history_item in self.trimmed_steps + list(self.recent_steps):
+            self.write_step(history_item)
+        self.trimmed_steps.clear()
+        self.recent_steps.clear()
+
+        if self.file:
+            self.file.close()
+            self.file = None
+            print(f"Agent history saved to {self.filename} ({self.step_count} steps, {os.path.getsize(self.filename) / 1024:.0f} KB).")
+        return self.filename
+
+
+# Function to read the steps of a saved agent history one at a time, without loading the whole file into memory
+def iter_history_steps(filename):
+    # Histories saved by AgentHistoryList.save_to_file() are a single JSON document
+    if filename.endswith(".json"):
+        with open(filename, "r", encoding="utf-8") as file:
+            yield from json.load(file)["history"]
+        return
+
+    with open_history_file(filename, "rt") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+# Function to summarize a history step in one line: its URL, next goal, actions and errors
+def format_history_step(step_number, step):
+    model_output = step.get("model_output") or {}
+    next_goal = (model_output.get("current_state") or {}).get("next_goal", "")
+    action_names = [name for action in model_output.get("action") or [] for name in action]
+    errors = [result["error"] for result in step.get("result", []) if result.get("error")]
+    return f"{step_number:>4}  {step['state'].get('url', '')}  {next_goal}  {action_names}" + (f"  errors: {errors}" if errors else "")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a saved agent history.")
+    parser.add_argument("filename", help="History file, e.g. agentResults.jsonl.gz")
+    parser.add_argument("--step", type=int, help="Print the full JSON of this step (1-based) instead of the summary of every step.")
+    args = parser.parse_args()
+
+    for step_number, step in enumerate(iter_history_steps(args.filename), start=1):
+        if args.step is None:
+            print(format_history_step(step_number, step))
+        elif step_number == args.step:
+            print(json.dumps(step, indent=2))
+            break
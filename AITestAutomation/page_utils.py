@@ -0,0 +1,136 @@
+import asyncio
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+
+# Resolves each selector in the page and checks its visibility with the same rule as Playwright's is_visible():
+# the first matching element has a non-empty bounding box and is not hidden through its style
+VISIBILITY_MAP_SCRIPT = """
+selectors => {
+    const isVisible = element => {
+        if (!element) {
+            return false;
+        }
+        const style = window.getComputedStyle(element);
+        if (style.visibility === 'hidden' || style.visibility === 'collapse') {
+            return false;
+        }
+        const rect = element.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0;
+    };
+
+    const visibilityMap = {};
+    for (const selector of selectors) {
+        try {
+            let element;
+            if (selector.startsWith('xpath=') || selector.startsWith('//')) {
+                const xpath = selector.replace(/^xpath=/, '');
+                element = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+            } else {
+                element = document.querySelector(selector.replace(/^css=/, ''));
+            }
+            visibilityMap[selector] = isVisible(element);
+        } catch (e) {
+            visibilityMap[selector] = null;
+        }
+    }
+    return visibilityMap;
+}
+"""
+
+# Resolves once the DOM has not changed for quiet_ms, or with false once timeout_ms has passed
+DOM_QUIET_SCRIPT = """
+([quietMs, timeoutMs]) => new Promise(resolve => {
+    let quietTimer = null;
+    let deadlineTimer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => finish(true), quietMs);
+    });
+    const finish = result => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(deadlineTimer);
+        resolve(result);
+    };
+    observer.observe(document, { childList: true, subtree: true, attributes: true, characterData: true });
+    quietTimer = setTimeout(() => finish(true), quietMs);
+    deadlineTimer = setTimeout(() => finish(false), timeoutMs);
+})
+"""
+
+
+# Function to check the visibility of several selectors in a single page.evaluate call instead of one is_visible() round-trip each
+async def get_visibility_map(page, selectors):
+    visibility_map = await page.evaluate(VISIBILITY_MAP_SCRIPT, list(selectors))
+
+    # Selectors of the Playwright specific engines (e.g. text="...") cannot be resolved in the page, so Playwright checks those
+    for selector, is_visible in visibility_map.items():
+        if is_visible is None:
+            visibility_map[selector] = await page.is_visible(selector)
+    return visibility_map
+
+
+# Function to wait until a dialog has closed, i.e. the given element of it is hidden or removed, returning False if it is still open
+async def wait_for_dialog_closed(page, selector, timeout=10000):
+    try:
+        await page.wait_for_selector(selector, state="hidden", timeout=timeout)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+# Function to wait until no request of the page has been in flight for idle_ms, returning False on timeout
+async def wait_for_network_idle(page, idle_ms=500, timeout=10000):
+    loop = asyncio.get_running_loop()
+    idle = asyncio.Event()
+    in_flight_requests = set()
+    idle_timer = None
+
+    def schedule_idle():
+        nonlocal idle_timer
+        if idle_timer:
+            idle_timer.cancel()
+        idle_timer = loop.call_later(idle_ms / 1000, idle.set) if not in_flight_requests else None
+
+    def on_request(request):
+        in_flight_requests.add(request)
+        schedule_idle()
+
+    def on_request_done(request):
+        in_flight_requests.discard(request)
+        schedule_idle()
+
+    # Requests that started before the listeners were attached are not tracked
+    page.on("request", on_request)
+    page.on("requestfinished", on_request_done)
+    page.on("requestfailed", on_request_done)
+    schedule_idle()
+    try:
+        await asyncio.wait_for(idle.wait(), timeout / 1000)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        if idle_timer:
+            idle_timer.cancel()
+        page.remove_listener("request", on_request)
+        page.remove_listener("requestfinished", on_request_done)
+        page.remove_listener("requestfailed", on_request_done)
+
+
+# Function to wait until the DOM has stopped changing for quiet_ms, e.g. after a table re-renders, returning False on timeout
+async def wait_for_dom_quiet(page, quiet_ms=300, timeout=10000):
+    return await page.evaluate(DOM_QUIET_SCRIPT, [quiet_ms, timeout])
+
+
+# Function to wait until the number of rows matching the selector differs from the previous count, returning False on timeout
+async def wait_for_row_count_change(page, row_selector, previous_count, timeout=10000):
+    try:
+        await page.wait_for_function(
+            "([selector, count]) => document.querySelectorAll(selector).length !== count",
+            arg=[row_selector, previous_count],
+            timeout=timeout
+        )
+        return True
+    except PlaywrightTimeoutError:
+        return False
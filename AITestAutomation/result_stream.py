@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import uuid
+
+
+RESULTS_STREAM_FILE = "test_case_results.jsonl"
+# The incremental report has its own file, so that a crashed run never leaves a partial report in place of the final one
+PARTIAL_REPORT_FILE = "test_case_results.partial.txt"
+CHECKPOINT_FILE = "test_case_checkpoint.json"
+
+
+# Function to format the Markdown lines of a single test case in the results report
+def format_test_case_report_lines(test_case):
+    report_lines = [f"\n### Test Case Title: {test_case.title}"]
+    report_lines.append("- **Steps Executed:**")
+    for step in test_case.steps:
+        report_lines.append(f"  - {step}")
+    report_lines.append(f"- **Expected Result:** \n  - {test_case.expected_result}")
+    report_lines.append(f"- **Actual Outcome Status:** \n  - {test_case.actual_outcome_status}")
+    report_lines.append("- **Actual Outcome Details:**")
+    for detail in test_case.actual_outcome_details:
+        report_lines.append(f"  - {detail}")
+    return report_lines
+
+
+# Class to stream the outcome of each test case as soon as it is known, to an append-only JSON lines file and an incremental Markdown report
+class ResultStream:
+    def __init__(self, stream_filename=RESULTS_STREAM_FILE, report_filename=PARTIAL_REPORT_FILE, checkpoint_filename=CHECKPOINT_FILE):
+        self.stream_filename = stream_filename
+        self.report_filename = report_filename
+        self.checkpoint_filename = checkpoint_filename
+        self.run_id = uuid.uuid4().hex
+        # Reported test cases by number, or by title for the unnumbered ones
+        self.reported_test_cases = {}
+        self.checkpoint = {"suite_fingerprint": None, "test_cases": {}}
+
+    # Load the results of the numbered test cases an interrupted run of the same suite already completed
+    def load_checkpoint(self, suite_fingerprint):
+        try:
+            with open(self.checkpoint_filename, "r") as file:
+                checkpoint = json.load(file)
+        except (OSError, ValueError):
+            return []
+        if checkpoint.get("suite_fingerprint") != suite_fingerprint:
+            print("The test cases changed since the checkpoint was written, nothing to resume.")
+            return []
+        return list(checkpoint["test_cases"].values())
+
+    # Start a new run, the JSON lines of earlier runs are kept while the Markdown report and checkpoint start over from the resumed results
+    def start(self, suite_fingerprint=None, resumed_test_cases=()):
+        self.reported_test_cases.clear()
+        self.checkpoint = {"suite_fingerprint": suite_fingerprint, "test_cases": {}}
+        self.save_checkpoint()
+        with open(self.report_filename, "w") as file:
+            file.write("## Test Case Results Summary")
+        self.write_event("run_started", resumed=len(resumed_test_cases))
+        for test_case in resumed_test_cases:
+            self.test_case_completed(test_case)
+
+    # Save the checkpoint to a temporary file first, so that a crash while writing never corrupts it
+    def save_checkpoint(self):
+        with open(f"{self.checkpoint_filename}.tmp", "w") as file:
+            json.dump(self.checkpoint, file, indent=4)
+        os.replace(f"{self.checkpoint_filename}.tmp", self.checkpoint_filename)
+
+    # Append one event to the JSON lines file, flushed right away so that a crash loses nothing written before it
+    def write_event(self, event, **fields):
+        with open(self.stream_filename, "a") as file:
+            file.write(json.dumps({"run_id": self.run_id, "timestamp": time.time(), "event": event, **fields}) + "\n")
+            file.flush()
+
+    # Record the progress of an agent step, so that a dashboard can follow the run live
+    def agent_step(self, step_number, next_goal=None, shard_index=None):
+        self.write_event("agent_step", step=step_number, next_goal=next_goal, shard=shard_index)
+
+    # Record a finished test case once, in both the JSON lines file and the Markdown report. A numbered test case is only recorded
+    # by its first outcome, e.g. its fallback action, as the agent's final summary may report it again under another title.
+    # Without checkpoint the outcome is reported but not checkpointed, so that a resumed run executes the test case again
+    def test_case_completed(self, test_case, checkpoint=True):
+        key = getattr(test_case, "number", None) or test_case.title
+        if key in self.reported_test_cases:
+            return
+        self.reported_test_cases[key] = test_case
+
+        self.write_event("test_case", test_case=test_case.model_dump())
+
+        # Only test cases matched to the suite are numbered (unmatched outcomes get 0), and only they can be skipped when resuming.
+        # A skipped test case never ran, so a resumed run executes it again
+        if checkpoint and getattr(test_case, "number", None) and test_case.actual_outcome_status != "Skipped":
+            self.checkpoint["test_cases"][str(test_case.number)] = test_case.model_dump()
+            self.save_checkpoint()
+        with open(self.report_filename, "a") as file:
+            file.write("\n" + "\n".join(format_test_case_report_lines(test_case)))
+        print(f"Test case '{test_case.title}' completed: {test_case.actual_outcome_status}")
+
+    # Finish the run with its final summary, streaming the test cases that were not reported while the run was going
+    def finish(self, test_cases_summary=None):
+        test_cases = test_cases_summary.test_cases if test_cases_summary else []
+        for test_case in test_cases:
+            self.test_case_completed(test_case)
+        statuses = [test_case.actual_outcome_status for test_case in test_cases]
+        self.write_event("run_finished", test_cases=len(test_cases), passed=statuses.count("Passed"), failed=statuses.count("Failed"))
+
+
+result_stream = ResultStream()
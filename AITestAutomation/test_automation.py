@@ -1,28 +1,36 @@
 import os  
+import re
+import ast
 import asyncio  
-import subprocess  
-import requests  
+import argparse
+import textwrap
 import time  
 import json  
-from langchain_openai import AzureChatOpenAI  
 from browser_use import Agent, Controller
 from browser_use.browser.browser import Browser, BrowserConfig
 from browser_use.browser.context import BrowserContext
 from browser_use.agent.views import ActionResult
+from langchain_core.callbacks import BaseCallbackHandler
 from pydantic import BaseModel
 from playwright.async_api import async_playwright
 from typing import List  
 from dotenv import load_dotenv  
+from chrome_launcher import launch_chrome, acquire_pooled_chrome, release_pooled_chrome
+from auth_state import load_auth_state, save_auth_state, apply_auth_state
+from page_utils import get_visibility_map, wait_for_dialog_closed, wait_for_dom_quiet
+from result_stream import ResultStream, format_test_case_report_lines
+from history_store import AgentHistoryWriter
+from tracing import tracer, trace_lane
+from chat_cassette import create_chat_model
   
 
-# Accessing environment variables from a .env file
+# Accessing environment variables from a .env file, the missing ones are reported when the test cases are executed
 load_dotenv()
-azure_openai_api_key = os.environ["AZURE_OPENAI_KEY"]  
-azure_openai_endpoint = os.environ["AZURE_OPENAI_ENDPOINT"]  
-azure_openai_api_version = os.environ["AZURE_OPENAI_API_VERSION"]  
-azure_openai_model = os.environ["AZURE_OPENAI_MODEL"]
-app_url = os.environ["APP_URL"]
-login_account = os.environ["LOGIN_ACCOUNT"]
+app_url = os.environ.get("APP_URL")
+login_account = os.environ.get("LOGIN_ACCOUNT")
+APP_SETTINGS = ["APP_URL", "LOGIN_ACCOUNT"]
+LLM_SETTINGS = ["AZURE_OPENAI_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_VERSION", "AZURE_OPENAI_MODEL"]
+CHROME_SETTINGS = ["CHROME_EXECUTABLE_PATH", "CHROME_USER_DATA_DIRECTORY"]
 
  
 # Classes to define the output format of the Agent as a Pydantic model
@@ -39,6 +47,72 @@ class TestCasesSummary(BaseModel):
 controller = Controller(output_model=TestCasesSummary)
 
 
+# Function to record every action the controller executes as a span of the trace, the BrowserUse browser actions and the fallback actions alike
+def trace_controller_actions(controller):
+    execute_action = controller.registry.execute_action
+
+    async def execute_traced_action(action_name, params, *args, **kwargs):
+        action = controller.registry.registry.actions.get(action_name)
+        category = "browser_action" if action and action.function.__module__.startswith("browser_use") else "fallback_action"
+        with tracer.span(action_name, category, params=params):
+            return await execute_action(action_name, params, *args, **kwargs)
+
+    controller.registry.execute_action = execute_traced_action
+
+
+trace_controller_actions(controller)
+
+# Test cases executed by the agent, the fallback actions report their outcome under the same names
+TEST_CASES = [
+    {
+        "name": "Navigation Display Test",
+        "description": "Verify that the site navigation at the top of the page displays all pages in the application.",
+        "steps": [
+            "- Observe the navigation bar at the top of the page."
+        ],
+        "expected_result": "All pages in the application are listed in the navigation bar."
+    },
+    {
+        "name": "Bulk Modify Owner Status Test",
+        "description": "Verify that the user can bulk change the owner status using the 'Bulk modify' button.",
+        "steps": [
+            "- Select multiple rows in the queue.",
+            "- Click the 'Bulk modify' button.",
+            "- Change the owner status."
+        ],
+        "expected_result": "The owner status of the selected rows is updated."
+    },
+    {
+        "name": "Single Row Owner Change Test",
+        "description": "Verify that the user can change the owner of a single row by selecting a name in the owner column.",
+        "steps": [
+            "- Select a single row in the queue.",
+            "- Click on the owner column.",
+            "- Select a new owner from the dropdown."
+        ],
+        "expected_result": "The owner of the selected row is updated."
+    }
+]
+
+# Streams the outcome of each test case as soon as it is known, next to the final report
+result_stream = ResultStream(report_filename="test_execution_results.partial.txt")
+
+# Saves the agent history as compressed JSON lines, keeping the screenshots and DOM of the last steps only
+agent_history_writer = AgentHistoryWriter("agentResults")
+
+# Spans of the agent steps in progress, ended when the step ends
+agent_step_spans = []
+
+# Fallback action that logs in to the application, the deterministic mode stops when it fails
+LOGIN_ACTION = "verify_user_login"
+
+# Outcome reported by the fallback actions in the extracted content of their ActionResult
+ACTION_RESULT_PATTERN = re.compile(
+    r"Title:\s*(?P<title>.*?)\s*\nActual outcome status:\s*(?P<status>.*?)\s*\nActual outcome details:\s*(?P<details>.*)",
+    re.DOTALL
+)
+
+
 # Define Playwright functions for individual test cases (as fallback mechanism)
 #-----------------------------------Test Case 1-----------------------------------
 @controller.action('Access the application using valid credentials.')
@@ -59,6 +133,19 @@ async def verify_user_login(browser: BrowserContext):
         actual_outcome_status = "Failed"  
         actual_outcome_details.append(f"Failed to load the login page: {str(e)}")
         print(f"Failed to load the login page: {e}")
+
+    # A restored login session lands directly on the dashboard, in which case the SSO flow is skipped
+    try:
+        dashboard = page.locator('text="Benefit plan queue"')
+        await dashboard.or_(page.locator('text="Log in with Email ID"')).first.wait_for(timeout=30000)
+        if await dashboard.is_visible():
+            print("Already logged in with the saved session, dashboard loaded successfully.")
+            return ActionResult(
+                extracted_content=f"Title: {title} \nActual outcome status: Passed \nActual outcome details: ['Benefits Configuration AI dashboard loaded with the saved login session.']",
+                include_in_memory=True
+            )
+    except Exception as e:
+        print(f"Failed to detect whether the saved login session is still valid: {e}")
     
     # Enter valid credentials  
     try: 
@@ -74,26 +161,34 @@ async def verify_user_login(browser: BrowserContext):
         actual_outcome_details.append(f"Failed to log in with the account {login_account}: {str(e)}")
         print(f"Failed to log in with the account {login_account}: {e}")
     
+    # A single deadline covers both the Authenticator approval and the redirect to the dashboard
+    timeout_seconds = 300
+    deadline = time.monotonic() + timeout_seconds
+
+    def remaining_ms():
+        return max(1, (deadline - time.monotonic()) * 1000)       # Playwright treats a timeout of 0 as no timeout
+
     # Wait for the Authenticator approval (if prompted)
+    approval_received = True
     try:
         authenticator_prompt_selector = 'text="Approve sign in request"'
         approval_required = await page.query_selector(authenticator_prompt_selector)
         
         if approval_required:  
             print("Authenticator prompt detected, waiting for approval...")
+            approval_url = page.url
+
+            # Approval lands the moment the prompt is removed from the page or the page navigates away
+            approval_events = {
+                asyncio.create_task(page.wait_for_selector(authenticator_prompt_selector, state="detached", timeout=remaining_ms())),
+                asyncio.create_task(page.wait_for_url(lambda url: url != approval_url, timeout=remaining_ms()))
+            }
             approval_received = False
-            start_time = time.time()  
-            timeout_seconds = 300
-    
-            # Loop to wait for user approval, with a timeout of 300 seconds
-            while time.time() - start_time < timeout_seconds:  
-                try:  
-                    # Check if the approval prompt is visible  
-                    await page.wait_for_selector(authenticator_prompt_selector, timeout=5000)  
-                    print("Waiting for user to approve the sign-in request...")  
-                except Exception:
-                    approval_received = True     # If the prompt is no longer visible, assume approval is complete
-                    break
+            while approval_events and not approval_received:
+                done, approval_events = await asyncio.wait(approval_events, return_when=asyncio.FIRST_COMPLETED)
+                approval_received = any(task.exception() is None for task in done)
+            for task in approval_events:
+                task.cancel()
 
             if not approval_received:
                 actual_outcome_status = "Failed"  
@@ -108,27 +203,21 @@ async def verify_user_login(browser: BrowserContext):
         actual_outcome_details.append(f"Failed during Authenticator approval process: {str(e)}")
         print(f"Failed during Authenticator approval process: {e}")
 
-    # Wait for the original login page to redirect to the dashboard
-    login_page = await page.is_visible('text="Log in with Email ID"')
-    if login_page:
-        await page.wait_for_timeout(10000)        # Wait for 10 seconds  
+    # Wait for the login page to redirect to the dashboard, proceeding as soon as the dashboard has loaded
+    if approval_received:
         print("Waiting for the original page to redirect to the dashboard...")  
-    
-        # Verify that the dashboard loads successfully
         try:
-            # Wait for the dashboard to fully load 
-            await page.wait_for_selector('text="Benefit plan queue"', timeout=10000)
+            await page.wait_for_selector('text="Benefit plan queue"', timeout=remaining_ms())
             print("Benefits Configuration AI dashboard loaded successfully.")  
             actual_outcome_status = "Passed"  
             actual_outcome_details.append("Benefits Configuration AI dashboard loaded successfully.")  
+
+            # Save the login session, so that later runs skip the SSO flow
+            await save_auth_state(page.context)
         except Exception as e:
             print(f"Failed to load the dashboard: {e}")
             actual_outcome_status = "Failed"  
             actual_outcome_details.append(f"Benefits Configuration AI dashboard did not load successfully: {str(e)}")
-    else:
-        print(f"Failed to re-direct to the dashboard: {e}")
-        actual_outcome_status = "Failed"  
-        actual_outcome_details.append(f"Benefits Configuration AI dashboard did not load successfully: {str(e)}")
     
     print(actual_outcome_status)  
     print(actual_outcome_details)
@@ -147,44 +236,27 @@ async def verify_site_nav(browser: BrowserContext):
     page = await browser.get_current_page()
     actual_outcome_details = []
 
-    # Observe the navigation bar at the top of the page to check visibility of each navigation item  
-    try:
-        home_visible = await page.is_visible('#menu-item-home')  
-    except Exception as e:  
-        home_visible = False  
-        actual_outcome_details.append(f"Failed to verify visibility of 'Home' page: {str(e)}")
-
-    try:
-        manage_plans_visible = await page.is_visible('#menu-item-manage-plans')
-    except Exception as e:  
-        manage_plans_visible = False  
-        actual_outcome_details.append(f"Failed to verify visibility of 'Manage Plans' page: {str(e)}") 
-
-    try:
-        support_visible = await page.is_visible('#menu-item-support')
-    except Exception as e:  
-        support_visible = False  
-        actual_outcome_details.append(f"Failed to verify visibility of 'Support' page: {str(e)}")
-
+    # Observe the navigation bar at the top of the page to check visibility of each navigation item in a single round-trip
+    navigation_items = {
+        "Home": '#menu-item-home',
+        "Manage plans": '#menu-item-manage-plans',
+        "Support": '#menu-item-support',
+        "Sign out": '#menu-item-sign-out'
+    }
     try:
-        sign_out_visible = await page.is_visible('#menu-item-sign-out')
+        visibility_map = await get_visibility_map(page, navigation_items.values())
     except Exception as e:  
-        sign_out_visible = False  
-        actual_outcome_details.append(f"Failed to verify visibility of 'Sign Out' page: {str(e)}")
+        visibility_map = {}
+        actual_outcome_details.append(f"Failed to verify visibility of the navigation items: {str(e)}")
 
-    if home_visible and manage_plans_visible and support_visible and sign_out_visible:
+    hidden_items = [item for item, selector in navigation_items.items() if not visibility_map.get(selector)]
+    if not hidden_items:
         actual_outcome_status = "Passed"  
         actual_outcome_details.append("Navigation items are visible and accessible.")  
     else:
         actual_outcome_status = "Failed"  
-        if not home_visible:  
-            actual_outcome_details.append("Home item is not visible.")  
-        if not manage_plans_visible:  
-            actual_outcome_details.append("Manage plans item is not visible.")  
-        if not support_visible:  
-            actual_outcome_details.append("Support item is not visible.")  
-        if not sign_out_visible:  
-            actual_outcome_details.append("Sign out item is not visible.")  
+        for item in hidden_items:
+            actual_outcome_details.append(f"{item} item is not visible.")  
     
     print(actual_outcome_status)
     print(actual_outcome_details)
@@ -238,8 +310,7 @@ async def bulk_modify_owner_status(browser: BrowserContext):
 
     # Wait for the dialog box to close and navigate back to the original page
     try:
-        await page.wait_for_timeout(2000)
-        if not await page.is_visible('text="Apply"'):       # If dialog box closes, the owner change passed
+        if await wait_for_dialog_closed(page, 'text="Apply"', timeout=5000):       # If dialog box closes, the owner change passed
             actual_outcome_status = "Passed"
             actual_outcome_details.append("The owner status of the selected rows is updated.") 
         else:
@@ -287,8 +358,9 @@ async def single_row_owner_change(browser: BrowserContext):
         actual_outcome_details.append(f"Failed to select owner from dropdown: {str(e)}")  
         print("Failed to select owner from dropdown.")
 
-    # Verify that the owner change was successful  
+    # Verify that the owner change was successful once the table has re-rendered
     try:
+        await wait_for_dom_quiet(page, timeout=5000)
         owner_changed = await page.is_visible('text="Second Name"', timeout=5000)
         if owner_changed:
             actual_outcome_status = "Passed"  
@@ -308,59 +380,214 @@ async def single_row_owner_change(browser: BrowserContext):
     )
 
 
-# Function to integrate BrowserUse and Playwright for browser automation and execute defined test cases
-async def executeTestCases():
-    # Define the prompt/task for the AI agent  
-    task = f"""  
-    **AI Agent Task: UI Testing Automation**  
-    **Objective: Execute defined test cases on the application and summarize the results.**
+# Function to start or lease the Chrome instance and connect BrowserUse to it
+async def initialize_browser():
+    pool_address = os.environ.get("BROWSER_POOL_ADDRESS")
+    if pool_address:
+        # Lease a warm, already authenticated Chrome instance from the browser pool daemon
+        lease = await acquire_pooled_chrome(pool_address)
+        browser = Browser(
+            config=BrowserConfig(
+                cdp_url=lease["cdp_url"],
+                keep_alive=True
+            )
+        )
+        return browser, lease
+
+    # Specify the path to our Chrome executable
+    chrome_path = os.environ["CHROME_EXECUTABLE_PATH"]
+    user_data_dir = os.environ["CHROME_USER_DATA_DIRECTORY"]
+    chrome_debug_port = 9222  
+
+    # Connect to our existing Chrome installation, start Chrome in debugging mode and wait until it is accessible
+    try:
+        with tracer.span("Chrome launch", "browser_launch", chrome_debug_port=chrome_debug_port) as span_args:
+            chrome_process, launch_latency = await launch_chrome(chrome_path, chrome_debug_port, user_data_dir)
+            span_args["launch_latency_seconds"] = round(launch_latency, 3)
+    except Exception as e:  
+        print(f"Failed to connect to Chrome: {e}")  
+
+    # Connect to the browser
+    browser = Browser(
+        config=BrowserConfig(
+            chrome_instance_path=chrome_path,
+            remote_debugging_port=chrome_debug_port
+        )
+    )
+    return browser, None
+
+
+# Function to format the test case results and save them to a text file
+def write_test_case_report(parsed_result, filename="test_execution_results.txt"):
+    report_lines = ["## Test Case Results Summary"]
+    # Iterate over each test-case to format and print
+    for test_case in parsed_result.test_cases:
+        report_lines.extend(format_test_case_report_lines(test_case))
+    
+    # Print the formatted report  
+    print("\n".join(report_lines))
  
-    ---
+    # Save the formatted report to a text file
+    with open(f"{filename}", "w") as file:  
+        file.write("\n".join(report_lines))  
+    print(f"Results saved to {filename}")
+
+
+# Function to parse the title, status and details a fallback action reported in its ActionResult
+def parse_action_result(action_result):
+    match = ACTION_RESULT_PATTERN.search(action_result.extracted_content or "")
+    if not match:
+        return None
+
+    try:
+        actual_outcome_details = ast.literal_eval(match["details"].strip())
+    except (ValueError, SyntaxError):
+        actual_outcome_details = [match["details"].strip()]
+    if not isinstance(actual_outcome_details, list):
+        actual_outcome_details = [actual_outcome_details]
+    return match["title"], match["status"], [str(detail) for detail in actual_outcome_details]
+
+
+# Function to build the reported test case of a fallback action's outcome, matched to its test case by title for the steps and expected result
+def build_test_case(outcome, action_description=""):
+    title, actual_outcome_status, actual_outcome_details = outcome
+    test_case = next((test_case for test_case in TEST_CASES if test_case["name"].lower() == title.strip().lower()), {})
+    return TestCase(
+        title=title,
+        steps=test_case.get("steps", [action_description]),
+        expected_result=test_case.get("expected_result", ""),
+        actual_outcome_status=actual_outcome_status,
+        actual_outcome_details=actual_outcome_details
+    )
+
+
+# Callback handler to record each call of the agent's language model as a span of the trace, with its token usage
+class TracingCallbackHandler(BaseCallbackHandler):
+    def __init__(self):
+        self.start_times = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.start_times[run_id] = time.monotonic()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.start_times[run_id] = time.monotonic()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        end_time = time.monotonic()
+
+        # Azure reports the usage in the LLM output, newer LangChain versions also attach it to the message
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if not token_usage and response.generations:
+            usage_metadata = getattr(response.generations[0][0].message, "usage_metadata", None) or {}
+            token_usage = {
+                "prompt_tokens": usage_metadata.get("input_tokens", 0),
+                "completion_tokens": usage_metadata.get("output_tokens", 0),
+                "total_tokens": usage_metadata.get("total_tokens", 0)
+            }
+
+        tracer.record_span(
+            "LLM call", "llm", self.start_times.pop(run_id, end_time), end_time,
+            prompt_tokens=token_usage.get("prompt_tokens", 0),
+            completion_tokens=token_usage.get("completion_tokens", 0),
+            total_tokens=token_usage.get("total_tokens", 0)
+        )
+
+
+# Function to start the span of an agent step, the LLM call and the actions of the step are recorded inside it
+async def trace_agent_step_start(agent):
+    agent_step_spans.append(tracer.begin(f"Step {agent.state.n_steps}", "agent_step"))
 
-    1. Access the application using valid credentials.
+
+# Function to stream the progress of each agent step and the outcome of every fallback action the step ran, end the span of the step,
+# and hand the step to the history writer so that the screenshots and DOM of older steps are left out of the saved history
+async def stream_agent_step_results(agent):
+    if not agent.state.history.history:
+        return
+    last_step = agent.state.history.history[-1]
+    next_goal = last_step.model_output.current_state.next_goal if last_step.model_output else None
+    result_stream.agent_step(len(agent.state.history.history), next_goal)
+
+    if agent_step_spans:
+        action_names = [name for action in (last_step.model_output.action if last_step.model_output else []) for name in action.model_dump(exclude_unset=True)]
+        errors = [action_result.error for action_result in last_step.result if action_result.error]
+        tracer.end(agent_step_spans.pop(), next_goal=next_goal, actions=action_names, errors=errors)
+
+    for action_result in last_step.result:
+        outcome = parse_action_result(action_result)
+        if outcome:
+            result_stream.test_case_completed(build_test_case(outcome))
+    agent_history_writer.add_step(last_step)
+
+
+# Function to get the fallback actions, i.e. the actions registered in this module, in the order they are defined
+def get_fallback_actions():
+    return [action for action in controller.registry.registry.actions.values() if action.function.__module__ == __name__]
+
+
+# Function to run the fallback actions one after the other against the browser, without the BrowserUse Agent or a language model
+async def execute_fallback_actions(browser_context, authenticated=False):
+    executed_test_cases = []
+
+    for action in get_fallback_actions():
+        if action.name == LOGIN_ACTION and authenticated:
+            print("Skipping the login, the browser already carries the saved login session.")
+            continue
+
+        try:
+            action_result = await controller.registry.execute_action(action.name, {}, browser=browser_context)
+            outcome = parse_action_result(action_result)
+        except Exception as e:
+            outcome = (action.description.rstrip("."), "Failed", [str(e)])
+        if not outcome:
+            outcome = (action.description.rstrip("."), "Failed", [f"The {action.name} action did not report an outcome."])
+
+        executed_test_case = build_test_case(outcome, action.description)
+        executed_test_cases.append(executed_test_case)
+        result_stream.test_case_completed(executed_test_case)
+
+        # None of the test cases can run without logging in
+        if action.name == LOGIN_ACTION and executed_test_case.actual_outcome_status != "Passed":
+            print("Authentication failed, stopping execution.")
+            break
+
+    return TestCasesSummary(test_cases=executed_test_cases)
+
+
+# Function to build the task of the BrowserUse agent, a browser that already carries the saved login session skips the SSO flow
+def build_agent_task(authenticated=False):
+    if authenticated:
+        login_steps = f"""1. The browser is already logged in to the application.
+        - Navigate to {app_url}.
+        - Wait for the dashboard to fully load before proceeding.
+            - Only if the login page is shown instead, Access the application using valid credentials."""
+    else:
+        login_steps = f"""1. Access the application using valid credentials.
         - Navigate to the login URL {app_url}.
         - Click 'Log in with SSO'.
         - Select the account {login_account}. 
         - Wait for Authenticator approval (if prompted).
             - If Authentication fails leading to Request being denied, **log an error and stop execution**.
-        - Wait for **up to 10 seconds** for the dashboard to fully load before proceeding.
+        - Wait for **up to 10 seconds** for the dashboard to fully load before proceeding."""
+
+    # List the test cases in the order they are to be executed
+    test_case_prompts = "\n\n".join(
+        f"        - **Test Case {number}**\n" + textwrap.indent(json.dumps(test_case, indent=4), " " * 12)
+        for number, test_case in enumerate(TEST_CASES, start=1)
+    )
+
+    # Define the prompt/task for the AI agent  
+    task = f"""  
+    **AI Agent Task: UI Testing Automation**  
+    **Objective: Execute defined test cases on the application and summarize the results.**
+ 
+    ---
+
+    {login_steps}
 
     2. After successfully logging in, execute each test case **only ONCE** in the following order:
         - Execute **each step in sequence** as defined in the test cases ONLY.
 
-        - **Test Case 1**
-            {{
-                "name": "Navigation Display Test",
-                "description": "Verify that the site navigation at the top of the page displays all pages in the application.",  
-                "steps": [
-                    "- Observe the navigation bar at the top of the page."  
-                ],  
-                "expected_result": "All pages in the application are listed in the navigation bar."  
-            }}
-
-        - **Test Case 2**
-            {{
-                "name": "Bulk Modify Owner Status Test",  
-                "description": "Verify that the user can bulk change the owner status using the 'Bulk modify' button.",  
-                "steps": [
-                    "- Select multiple rows in the queue.",  
-                    "- Click the 'Bulk modify' button.",  
-                    "- Change the owner status."
-                ],  
-                "expected_result": "The owner status of the selected rows is updated."  
-            }}
-
-        - **Test Case 3**
-            {{
-                "name": "Single Row Owner Change Test",
-                "description": "Verify that the user can change the owner of a single row by selecting a name in the owner column.",
-                "steps": [
-                    "- Select a single row in the queue.",
-                    "- Click on the owner column.",
-                    "- Select a new owner from the dropdown."
-                ],
-                "expected_result": "The owner of the selected row is updated."
-            }}
+{test_case_prompts}
 
     3. After executing a test case ONCE, whether it fails or passes:
         - **ALWAYS navigate back to the original dashboard or Home page** before executing the next test case.
@@ -389,60 +616,67 @@ async def executeTestCases():
         - DO NOT take any action unless explicitly instructed. Follow the instructions exactly as written.
     
     """
- 
-    # Initialize the AzureChatOpenAI language model with the provided credentials
-    llm = AzureChatOpenAI(
-        model_name=azure_openai_model,
-        openai_api_key=azure_openai_api_key,
-        azure_endpoint=azure_openai_endpoint,
-        deployment_name=azure_openai_model,
-        api_version=azure_openai_api_version,
-        temperature=0
-    )
+    return task
+
+
+# Function to list the settings a run needs that are missing from the environment, the language model is only needed by an agent run
+# that does not replay a cassette, and the local Chrome only without a browser pool
+def get_missing_settings(deterministic=False):
+    required_settings = APP_SETTINGS + ([] if deterministic or os.environ.get("CHAT_CASSETTE_MODE") == "replay" else LLM_SETTINGS)
+    if not os.environ.get("BROWSER_POOL_ADDRESS"):
+        required_settings += CHROME_SETTINGS
+    return [setting for setting in required_settings if not os.environ.get(setting)]
+
+
+# Function to integrate BrowserUse and Playwright for browser automation and execute defined test cases
+async def executeTestCases():
+    # Imported here, so that the deterministic run does not pay for LangChain
+    from langchain_openai import AzureChatOpenAI
+
+    # Reuse the saved login session if it has not expired, in which case the agent skips the SSO flow
+    storage_state = load_auth_state()
+    task = build_agent_task(authenticated=storage_state is not None)
+
+    # Initialize the AzureChatOpenAI language model with the provided credentials, recorded to or replayed from a cassette when CHAT_CASSETTE_MODE is set
+    llm = create_chat_model(lambda: AzureChatOpenAI(
+        model_name=os.environ["AZURE_OPENAI_MODEL"],
+        openai_api_key=os.environ["AZURE_OPENAI_KEY"],
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        deployment_name=os.environ["AZURE_OPENAI_MODEL"],
+        api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        temperature=0,
+        callbacks=[TracingCallbackHandler()]
+    ))
   
+    lease = None
     try:
-        # Specify the path to our Chrome executable
-        chrome_path = os.environ["CHROME_EXECUTABLE_PATH"]
-        user_data_dir = os.environ["CHROME_USER_DATA_DIRECTORY"]
-        chrome_debug_port = 9222  
-
-        # Connect to our existing Chrome installation and start Chrome in debugging mode  
-        subprocess.Popen([chrome_path, f'--remote-debugging-port={chrome_debug_port}', f'--user-data-dir={user_data_dir}'])  
-        time.sleep(5)  # Wait for Chrome to start
-
-        try:  
-            response = requests.get(f'http://localhost:{chrome_debug_port}/json/version')  
-            if response.status_code == 200:  
-                print("Chrome is running and accessible.")  
-            else:  
-                print(f"Unexpected status code: {response.status_code}")  
-        except Exception as e:  
-            print(f"Failed to connect to Chrome: {e}")  
+        browser, lease = await initialize_browser()
 
-        # Connect to the browser
-        browser = Browser(
-            config=BrowserConfig(
-                chrome_instance_path=chrome_path,
-                remote_debugging_port=chrome_debug_port
-            )
-        )
+        # Inject the saved login session into the agent's browser context
+        browser_context = BrowserContext(browser=browser, config=browser.config.new_context_config)
+        if storage_state:
+            session = await browser_context.get_session()
+            await apply_auth_state(session.context, storage_state)
 
         # Initialize the BrowserUse Agent with the defined task, language model, browser, and controller
         agent = Agent(
             task=task, 
             llm=llm, 
             browser=browser, 
+            browser_context=browser_context,
             controller=controller, 
             tool_calling_method="function_calling"
         )
 
-        # Run the agent asynchronously and capture the run  
+        # Run the agent asynchronously and capture the run, streaming each test case's outcome as soon as it is known
         print("Starting BrowserUse agent run...")
-        history = await agent.run()
+        result_stream.start()
+        with trace_lane():
+            history = await agent.run(on_step_start=trace_agent_step_start, on_step_end=stream_agent_step_results)
         print("BrowserUse agent run completed.") 
 
-        # Save entire history to a file
-        history.save_to_file("agentResults.json")
+        # Save the history to a file, with the full payload of the last steps only
+        agent_history_writer.finish(history)
 
         # Extract and print the final result from the agent's run history
         result = history.final_result()
@@ -454,37 +688,74 @@ async def executeTestCases():
 
             # Validate and parse the JSON result using Pydantic
             parsed_result: TestCasesSummary = TestCasesSummary.model_validate_json(result)  
+            result_stream.finish(parsed_result)
             
-            report_lines = ["## Test Case Results Summary"]
-            # Iterate over each test-case to format and print
-            for test_case in parsed_result.test_cases:
-                report_lines.append(f"\n### Test Case Title: {test_case.title}") 
-                report_lines.append("- **Steps Executed:**")  
-                for step in test_case.steps:  
-                    report_lines.append(f"  - {step}")  
-                report_lines.append(f"- **Expected Result:** \n  - {test_case.expected_result}")  
-                report_lines.append(f"- **Actual Outcome Status:** \n  - {test_case.actual_outcome_status}")  
-                report_lines.append("- **Actual Outcome Details:**")
-                for detail in test_case.actual_outcome_details:  
-                    report_lines.append(f"  - {detail}")
-    
-            # Print the formatted report  
-            print("\n".join(report_lines))
- 
-            # Save the formatted report to a text file
-            filename = "test_execution_results.txt"
-            with open(f"{filename}", "w") as file:  
-                file.write("\n".join(report_lines))  
-            print(f"Results saved to {filename}")
+            write_test_case_report(parsed_result)
  
         else:  
+            result_stream.finish()
             print('No results to display. The agent did not produce any output.')
 
-        # Close the browser instance
+        # Close the browser context and instance
+        await browser_context.close()
         await browser.close()
     
     except Exception as e:  
         print(f"Failed to connect to the browser or execute the task: {e}")
+
+    finally:
+        if lease:
+            await release_pooled_chrome(lease)
+
+
+# Function to execute the test cases with their fallback actions only, so that the run needs no language model round-trips
+async def executeTestCasesDeterministic():
+    storage_state = load_auth_state()
+
+    lease = None
+    try:
+        browser, lease = await initialize_browser()
+
+        # Inject the saved login session into the browser context
+        browser_context = BrowserContext(browser=browser, config=browser.config.new_context_config)
+        if storage_state:
+            session = await browser_context.get_session()
+            await apply_auth_state(session.context, storage_state)
+
+        print("Starting deterministic run of the fallback actions...")
+        result_stream.start()
+        parsed_result = await execute_fallback_actions(browser_context, authenticated=storage_state is not None)
+        result_stream.finish(parsed_result)
+        print("Deterministic run completed.")
+
+        write_test_case_report(parsed_result)
+
+        # Close the browser context and instance
+        await browser_context.close()
+        await browser.close()
+
+    except Exception as e:  
+        print(f"Failed to connect to the browser or execute the fallback actions: {e}")
+
+    finally:
+        if lease:
+            await release_pooled_chrome(lease)
  
 if __name__ == "__main__":  
-    asyncio.run(executeTestCases())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Execute the test cases using BrowserUse and Playwright.")
+    parser.add_argument("--deterministic", action="store_true", help="Run the fallback actions directly, without the BrowserUse agent and language model.")
+    args = parser.parse_args()
+
+    missing_settings = get_missing_settings(args.deterministic)
+    if missing_settings:
+        parser.exit(1, f"Missing settings: {', '.join(missing_settings)}. Add them to the .env file.\n")
+
+    # Time the run as a trace, to see whether it is spent in LLM latency, page loads or agent steps
+    try:
+        with tracer.span("Test suite", "suite", deterministic=args.deterministic):
+            if args.deterministic:
+                asyncio.run(executeTestCasesDeterministic())
+            else:
+                asyncio.run(executeTestCases())
+    finally:
+        tracer.save("execution_trace.json")
\ No newline at end of file
@@ -1,27 +1,17 @@
 import os  
 import asyncio  
-import subprocess  
-import requests  
-import time  
 import json  
-from langchain_openai import AzureChatOpenAI  
-from browser_use import Agent, Controller
-from browser_use.browser.browser import Browser, BrowserConfig
 from pydantic import BaseModel
 from typing import List  
 from dotenv import load_dotenv  
+from chrome_launcher import launch_chrome, acquire_pooled_chrome, release_pooled_chrome
   
 
-# Accessing environment variables from a .env file
+# Accessing environment variables from a .env file, they are read and validated when the test cases are executed
 load_dotenv()
-azure_openai_api_key = os.environ["AZURE_OPENAI_KEY"]  
-azure_openai_endpoint = os.environ["AZURE_OPENAI_ENDPOINT"]  
-azure_openai_api_version = os.environ["AZURE_OPENAI_API_VERSION"]  
-azure_openai_model = os.environ["AZURE_OPENAI_MODEL"]
-app_url = os.environ["APP_URL"]
-login_account = os.environ["LOGIN_ACCOUNT"]
-chrome_path = os.environ["CHROME_EXECUTABLE_PATH"]
-user_data_dir = os.environ["CHROME_USER_DATA_DIRECTORY"]
+APP_SETTINGS = ["APP_URL", "LOGIN_ACCOUNT"]
+LLM_SETTINGS = ["AZURE_OPENAI_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_VERSION", "AZURE_OPENAI_MODEL"]
+CHROME_SETTINGS = ["CHROME_EXECUTABLE_PATH", "CHROME_USER_DATA_DIRECTORY"]
 
  
 # Classes to define the output format of the Agent as a Pydantic model
@@ -34,12 +24,33 @@ class TestCase(BaseModel):
   
 class TestCasesSummary(BaseModel):  
     test_cases: List[TestCase]  
-  
-controller = Controller(output_model=TestCasesSummary)
+
+
+# Function to list the settings missing from the environment, the language model is only needed when the run does not replay a cassette
+# and the local Chrome only without a browser pool
+def get_missing_settings():
+    required_settings = APP_SETTINGS + ([] if os.environ.get("CHAT_CASSETTE_MODE") == "replay" else LLM_SETTINGS)
+    required_settings += [] if os.environ.get("BROWSER_POOL_ADDRESS") else CHROME_SETTINGS
+    return [setting for setting in required_settings if not os.environ.get(setting)]
 
 
 # Function to initialize BrowserUse Agent for browser automation and execute defined test cases
 async def executeTestCases():
+    missing_settings = get_missing_settings()
+    if missing_settings:
+        print(f"Missing settings: {', '.join(missing_settings)}. Add them to the .env file.")
+        return
+
+    # Imported here, so that loading this module does not pay for LangChain and BrowserUse
+    from langchain_openai import AzureChatOpenAI  
+    from browser_use import Agent, Controller
+    from browser_use.browser.browser import Browser, BrowserConfig
+    from chat_cassette import create_chat_model
+
+    app_url = os.environ["APP_URL"]
+    login_account = os.environ["LOGIN_ACCOUNT"]
+    controller = Controller(output_model=TestCasesSummary)
+
     # Define the prompt/task for the AI agent  
     task = f"""  
     **AI Agent Task: UI Testing Automation**  
@@ -148,44 +159,49 @@ async def executeTestCases():
     
     """
  
-    # Initialize the AzureChatOpenAI language model with the provided credentials
-    llm = AzureChatOpenAI(
-        model_name=azure_openai_model,
-        openai_api_key=azure_openai_api_key,
-        azure_endpoint=azure_openai_endpoint,
-        deployment_name=azure_openai_model,
-        api_version=azure_openai_api_version,
+    # Initialize the AzureChatOpenAI language model with the provided credentials, recorded to or replayed from a cassette when CHAT_CASSETTE_MODE is set
+    llm = create_chat_model(lambda: AzureChatOpenAI(
+        model_name=os.environ["AZURE_OPENAI_MODEL"],
+        openai_api_key=os.environ["AZURE_OPENAI_KEY"],
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        deployment_name=os.environ["AZURE_OPENAI_MODEL"],
+        api_version=os.environ["AZURE_OPENAI_API_VERSION"],
         temperature=0,
         max_retries=2
-    )
+    ))
     #print(llm.invoke(task))
   
+    lease = None
     try:
-        # Specify the path to our Chrome executable
-        chrome_path = os.environ["CHROME_EXECUTABLE_PATH"]
-        user_data_dir = os.environ["CHROME_USER_DATA_DIRECTORY"]
-        chrome_debug_port = 9222  
-
-        # Connect to our existing Chrome installation and start Chrome in debugging mode  
-        subprocess.Popen([chrome_path, f'--remote-debugging-port={chrome_debug_port}', f'--user-data-dir={user_data_dir}'])  
-        time.sleep(5)  # Wait for Chrome to start
-
-        try:  
-            response = requests.get(f'http://localhost:{chrome_debug_port}/json/version')  
-            if response.status_code == 200:  
-                print("Chrome is running and accessible.")  
-            else:  
-                print(f"Unexpected status code: {response.status_code}")  
-        except Exception as e:  
-            print(f"Failed to connect to Chrome: {e}")  
-
-        # Connect to the browser
-        browser = Browser(
-            config=BrowserConfig(
-                chrome_instance_path=chrome_path,
-                remote_debugging_port=chrome_debug_port
+        pool_address = os.environ.get("BROWSER_POOL_ADDRESS")
+        if pool_address:
+            # Lease a warm, already authenticated Chrome instance from the browser pool daemon
+            lease = await acquire_pooled_chrome(pool_address)
+            browser = Browser(
+                config=BrowserConfig(
+                    cdp_url=lease["cdp_url"],
+                    keep_alive=True
+                )
+            )
+        else:
+            # Specify the path to our Chrome executable
+            chrome_path = os.environ["CHROME_EXECUTABLE_PATH"]
+            user_data_dir = os.environ["CHROME_USER_DATA_DIRECTORY"]
+            chrome_debug_port = 9222  
+
+            # Connect to our existing Chrome installation, start Chrome in debugging mode and wait until it is accessible
+            try:
+                chrome_process, launch_latency = await launch_chrome(chrome_path, chrome_debug_port, user_data_dir)
+            except Exception as e:  
+                print(f"Failed to connect to Chrome: {e}")  
+
+            # Connect to the browser
+            browser = Browser(
+                config=BrowserConfig(
+                    chrome_instance_path=chrome_path,
+                    remote_debugging_port=chrome_debug_port
+                )
             )
-        )
 
         # Initialize the BrowserUse Agent with the defined task, language model, browser, and controller
         agent = Agent(
@@ -245,6 +261,10 @@ async def executeTestCases():
     
     except Exception as e:  
         print(f"Failed to connect to the browser or execute the task: {e}")
+
+    finally:
+        if lease:
+            await release_pooled_chrome(lease)
  
 if __name__ == "__main__":  
     asyncio.run(executeTestCases())
\ No newline at end of file
@@ -0,0 +1,218 @@
+import os
+import json
+import uuid
+import shutil
+import asyncio
+import argparse
+import logging
+import tempfile
+import psutil
+from dotenv import load_dotenv
+from chrome_launcher import launch_chrome
+
+
+DEFAULT_POOL_ADDRESS = "localhost:9300"
+
+
+# Class to track a warm Chrome instance kept by the pool
+class PooledChrome:
+    def __init__(self, slot, chrome_debug_port):
+        self.slot = slot
+        self.chrome_debug_port = chrome_debug_port
+        self.user_data_dir = os.path.join(tempfile.gettempdir(), f"chrome-pool-{os.getpid()}-{slot}")
+        self.chrome_process = None
+        self.launch_latency = None
+        self.uses = 0
+        self.lease_id = None
+
+    @property
+    def cdp_url(self):
+        return f"http://localhost:{self.chrome_debug_port}"
+
+    # Resident memory of Chrome and all of its renderer/GPU child processes, in MB
+    def memory_mb(self):
+        try:
+            process = psutil.Process(self.chrome_process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except psutil.Error:
+            return 0.0
+
+    def is_running(self):
+        return self.chrome_process is not None and self.chrome_process.poll() is None
+
+    def info(self):
+        return {
+            "slot": self.slot,
+            "lease_id": self.lease_id,
+            "cdp_url": self.cdp_url,
+            "uses": self.uses,
+            "launch_latency_seconds": round(self.launch_latency, 3) if self.launch_latency is not None else None,
+            "memory_mb": round(self.memory_mb(), 1) if self.is_running() else 0.0,
+            "running": self.is_running()
+        }
+
+
+# Class to keep a fixed number of authenticated Chrome instances warm and lease them out to test runs
+class BrowserPool:
+    def __init__(self, chrome_path, user_data_dir, size, base_port, max_uses, max_memory_mb):
+        self.chrome_path = chrome_path
+        self.user_data_dir = user_data_dir
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.instances = [PooledChrome(slot, base_port + slot) for slot in range(size)]
+        self.idle_instances = asyncio.Queue()
+
+    async def start(self):
+        await asyncio.gather(*(self.launch(instance) for instance in self.instances))
+        for instance in self.instances:
+            self.idle_instances.put_nowait(instance)
+        print(f"Browser pool started with {len(self.instances)} warm Chrome instances.")
+
+    # Clone the authenticated profile so every instance starts logged in, then launch Chrome on it
+    async def launch(self, instance):
+        shutil.rmtree(instance.user_data_dir, ignore_errors=True)
+        await asyncio.to_thread(
+            shutil.copytree,
+            self.user_data_dir,
+            instance.user_data_dir,
+            ignore=shutil.ignore_patterns("Singleton*", "lockfile", "*Cache")
+        )
+        instance.chrome_process, instance.launch_latency = await launch_chrome(self.chrome_path, instance.chrome_debug_port, instance.user_data_dir)
+        instance.uses = 0
+
+    async def stop(self, instance):
+        if instance.is_running():
+            instance.chrome_process.terminate()
+            await asyncio.to_thread(instance.chrome_process.wait)
+        shutil.rmtree(instance.user_data_dir, ignore_errors=True)
+
+    async def recycle(self, instance, reason):
+        print(f"Recycling Chrome instance {instance.slot}: {reason}")
+        await self.stop(instance)
+        await self.launch(instance)
+
+    async def acquire(self):
+        instance = await self.idle_instances.get()
+        if not instance.is_running():
+            try:
+                await self.recycle(instance, "Chrome is no longer running.")
+            except Exception:
+                # Put the slot back, a failed relaunch must not shrink the pool, the next acquire tries to relaunch it again
+                self.idle_instances.put_nowait(instance)
+                raise
+        instance.uses += 1
+        instance.lease_id = uuid.uuid4().hex
+        logging.info(f"Leased Chrome instance {instance.slot} ({instance.lease_id}).")
+        return instance
+
+    async def release(self, instance):
+        logging.info(f"Released Chrome instance {instance.slot} ({instance.lease_id}).")
+        instance.lease_id = None
+        try:
+            if not instance.is_running():
+                await self.recycle(instance, "Chrome is no longer running.")
+            elif self.max_uses and instance.uses >= self.max_uses:
+                await self.recycle(instance, f"reached {instance.uses} uses.")
+            elif self.max_memory_mb and instance.memory_mb() > self.max_memory_mb:
+                await self.recycle(instance, f"memory above {self.max_memory_mb} MB.")
+        except Exception as e:
+            print(f"Failed to recycle Chrome instance {instance.slot}: {e}")
+        self.idle_instances.put_nowait(instance)
+
+    async def shutdown(self):
+        await asyncio.gather(*(self.stop(instance) for instance in self.instances))
+        print("Browser pool stopped.")
+
+
+# Function to serve one client connection, the instances it leased are released when the client disconnects
+async def handle_pool_client(pool, shutdown_event, reader, writer):
+    leases = {}
+    try:
+        while line := await reader.readline():
+            request = json.loads(line)
+            command = request.get("command")
+
+            if command == "acquire":
+                instance = await pool.acquire()
+                leases[instance.lease_id] = instance
+                reply = {"lease_id": instance.lease_id, "cdp_url": instance.cdp_url, "chrome_debug_port": instance.chrome_debug_port}
+            elif command == "release" and request.get("lease_id") in leases:
+                await pool.release(leases.pop(request["lease_id"]))
+                reply = {"released": request["lease_id"]}
+            elif command == "status":
+                reply = {"instances": [instance.info() for instance in pool.instances]}
+            elif command == "shutdown":
+                reply = {"shutdown": True}
+                shutdown_event.set()
+            else:
+                reply = {"error": f"Unknown command or lease: {request}"}
+
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+
+    except Exception as e:
+        print(f"Browser pool client connection failed: {e}")
+
+    finally:
+        for instance in leases.values():
+            await pool.release(instance)
+        writer.close()
+
+
+# Function to run the browser pool daemon until a shutdown command is received
+async def serve_browser_pool(pool_address, size, base_port, max_uses, max_memory_mb):
+    pool = BrowserPool(
+        chrome_path=os.environ["CHROME_EXECUTABLE_PATH"],
+        user_data_dir=os.environ["CHROME_USER_DATA_DIRECTORY"],
+        size=size,
+        base_port=base_port,
+        max_uses=max_uses,
+        max_memory_mb=max_memory_mb
+    )
+    await pool.start()
+
+    shutdown_event = asyncio.Event()
+    host, port = pool_address.rsplit(":", 1)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_pool_client(pool, shutdown_event, reader, writer),
+        host,
+        int(port)
+    )
+    print(f"Browser pool listening on {pool_address}.")
+
+    try:
+        async with server:
+            await shutdown_event.wait()
+    finally:
+        await pool.shutdown()
+
+
+# Function to send a single command to a running browser pool daemon
+async def send_pool_command(pool_address, command):
+    host, port = pool_address.rsplit(":", 1)
+    reader, writer = await asyncio.open_connection(host, int(port))
+    writer.write((json.dumps({"command": command}) + "\n").encode())
+    await writer.drain()
+    reply = json.loads(await reader.readline())
+    writer.close()
+    return reply
+
+
+if __name__ == "__main__":
+    # Accessing environment variables from a .env file
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Keep warm, authenticated Chrome instances running and lease them to test runs.")
+    parser.add_argument("command", choices=["serve", "status", "shutdown"])
+    parser.add_argument("--address", default=os.environ.get("BROWSER_POOL_ADDRESS") or DEFAULT_POOL_ADDRESS)
+    parser.add_argument("--size", type=int, default=int(os.environ.get("BROWSER_POOL_SIZE") or 2), help="Number of warm Chrome instances.")
+    parser.add_argument("--base-port", type=int, default=9322, help="Debugging port of the first instance, the others use the next ports up.")
+    parser.add_argument("--max-uses", type=int, default=int(os.environ.get("BROWSER_POOL_MAX_USES") or 20), help="Recycle an instance after this many leases (0 disables).")
+    parser.add_argument("--max-memory-mb", type=int, default=int(os.environ.get("BROWSER_POOL_MAX_MEMORY_MB") or 2048), help="Recycle an instance above this memory (0 disables).")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(serve_browser_pool(args.address, args.size, args.base_port, args.max_uses, args.max_memory_mb))
+    else:
+        print(json.dumps(asyncio.run(send_pool_command(args.address, args.command)), indent=4))
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import argparse
+from cryptography.fernet import Fernet, InvalidToken
+from dotenv import load_dotenv
+
+
+AUTH_STATE_FILE = ".auth_state"
+DEFAULT_AUTH_STATE_TTL_MINUTES = 480
+
+# Restores the saved localStorage entries of the current origin before any script of the page runs
+LOCAL_STORAGE_INIT_SCRIPT = """
+(origins => {
+    const savedOrigin = origins.find(origin => origin.origin === window.location.origin);
+    if (!savedOrigin) {
+        return;
+    }
+    try {
+        for (const { name, value } of savedOrigin.localStorage) {
+            if (window.localStorage.getItem(name) === null) {
+                window.localStorage.setItem(name, value);
+            }
+        }
+    } catch (e) {}
+})(__ORIGINS__);
+"""
+
+
+# Function to get the cipher for the snapshot from the AUTH_STATE_KEY environment variable, snapshots are disabled without it
+def get_auth_state_cipher():
+    auth_state_key = os.environ.get("AUTH_STATE_KEY")
+    if not auth_state_key:
+        return None
+    return Fernet(auth_state_key.encode("utf-8"))
+
+
+# Function to save the cookies and localStorage of an authenticated Playwright context, encrypted and with an expiry
+async def save_auth_state(context, filename=AUTH_STATE_FILE):
+    cipher = get_auth_state_cipher()
+    if not cipher:
+        print("AUTH_STATE_KEY is not set, the login session is not saved.")
+        return False
+
+    try:
+        ttl_minutes = float(os.environ.get("AUTH_STATE_TTL_MINUTES") or DEFAULT_AUTH_STATE_TTL_MINUTES)
+        saved_at = time.time()
+        snapshot = {
+            "saved_at": saved_at,
+            "expires_at": saved_at + ttl_minutes * 60,
+            "storage_state": await context.storage_state()
+        }
+        token = cipher.encrypt(json.dumps(snapshot).encode("utf-8"))
+
+        # Write to a temporary file readable by the owner only, then swap it in so that readers never see a partial snapshot
+        file_descriptor = os.open(f"{filename}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(token)
+        os.replace(f"{filename}.tmp", filename)
+    except Exception as e:
+        print(f"Failed to save the login session: {e}")
+        return False
+
+    print(f"Login session saved to {filename}, valid for {ttl_minutes:g} minutes.")
+    return True
+
+
+# Function to load the saved login session, returning None if there is none or it is stale and the login has to be redone
+def load_auth_state(filename=AUTH_STATE_FILE):
+    cipher = get_auth_state_cipher()
+    if not cipher or not os.path.exists(filename):
+        return None
+
+    try:
+        with open(filename, "rb") as file:
+            snapshot = json.loads(cipher.decrypt(file.read()))
+    except (OSError, ValueError, InvalidToken) as e:
+        print(f"Failed to read the saved login session, logging in again: {str(e) or type(e).__name__}")
+        return None
+
+    if snapshot["expires_at"] <= time.time():
+        print("The saved login session has expired, logging in again.")
+        return None
+    return snapshot["storage_state"]
+
+
+# Function to inject a saved login session into a Playwright context so that new pages start out authenticated
+async def apply_auth_state(context, storage_state):
+    await context.add_cookies(storage_state.get("cookies", []))
+    origins = storage_state.get("origins", [])
+    if origins:
+        await context.add_init_script(script=LOCAL_STORAGE_INIT_SCRIPT.replace("__ORIGINS__", json.dumps(origins)))
+    print(f"Restored the saved login session ({len(storage_state.get('cookies', []))} cookies, {len(origins)} origins).")
+
+
+# Function to remove the saved login session, forcing the next run to log in interactively
+def invalidate_auth_state(filename=AUTH_STATE_FILE):
+    if os.path.exists(filename):
+        os.remove(filename)
+        return True
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the saved login session.")
+    parser.add_argument("command", choices=["generate-key", "status", "invalidate"])
+    args = parser.parse_args()
+
+    if args.command == "generate-key":
+        print(Fernet.generate_key().decode("utf-8"))
+    elif args.command == "status":
+        load_dotenv()
+        storage_state = load_auth_state()
+        print("Saved login session is valid." if storage_state else "No valid saved login session.")
+    else:
+        print("Saved login session removed." if invalidate_auth_state() else "No saved login session to remove.")
@@ -0,0 +1,175 @@
+import os
+import ast
+import sys
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+# Only light modules are imported here, BrowserUse, LangChain and the OpenAI client are imported by the subcommands that need them
+
+
+# Settings each subcommand reads from the .env file
+LLM_SETTINGS = ["AZURE_OPENAI_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_VERSION", "AZURE_OPENAI_MODEL"]
+APP_SETTINGS = ["APP_URL", "LOGIN_ACCOUNT"]
+CHROME_SETTINGS = ["CHROME_EXECUTABLE_PATH", "CHROME_USER_DATA_DIRECTORY"]
+
+
+# Function to list the settings a subcommand needs that are missing from the environment
+def get_missing_settings(command, deterministic=False):
+    required_settings = list(APP_SETTINGS)
+    # A run that replays the chat model's responses from a cassette does not call Azure
+    if command == "generate" or not (deterministic or os.environ.get("CHAT_CASSETTE_MODE") == "replay"):
+        required_settings += LLM_SETTINGS
+    # A browser pool lends out Chrome instances, so the local Chrome is only needed without one
+    if command == "run" and not os.environ.get("BROWSER_POOL_ADDRESS"):
+        required_settings += CHROME_SETTINGS
+    return [setting for setting in required_settings if not os.environ.get(setting)]
+
+
+# Function to stop with a readable message when a subcommand is missing settings, instead of a KeyError deep in a run
+def require_settings(command, deterministic=False):
+    missing_settings = get_missing_settings(command, deterministic)
+    if missing_settings:
+        sys.exit(f"Missing settings for `{command}`: {', '.join(missing_settings)}. Add them to the .env file.")
+
+
+# Function to list the fallback actions of the generated module without importing it (importing it needs BrowserUse)
+def list_generated_actions(filename):
+    if not os.path.exists(filename):
+        return []
+
+    from test_scripts_generation import is_controller_action
+    with open(filename, "r") as file:
+        tree = ast.parse(file.read())
+
+    actions = []
+    for node in tree.body:
+        for decorator in getattr(node, "decorator_list", []):
+            if is_controller_action(decorator):
+                description = decorator.args[0].value if decorator.args and isinstance(decorator.args[0], ast.Constant) else ""
+                actions.append((node.name, description))
+    return actions
+
+
+# Function to print the free-form test cases that are not cached yet, listing and planning only parse the test cases locally or from the cache
+def print_unparsed_test_cases(unparsed_test_cases):
+    if not unparsed_test_cases:
+        return
+    print(f"\n{len(unparsed_test_cases)} free-form test cases need a GPT parse, run `generate` or `run` to parse them:")
+    for number, category, name in unparsed_test_cases:
+        print(f"{number or '':>4}  {category.split()[0].lower() if category else '':<8}  {name}  (needs GPT parse)")
+
+
+# Function to estimate the tokens of a prompt, about four characters per token for English text
+def estimate_tokens(text):
+    return len(text) // 4
+
+
+# Subcommand to generate the BrowserUse prompt and the fallback actions from the test cases
+def generate_command(args):
+    require_settings("generate")
+    from test_scripts_generation import automation_scripts_generation
+    asyncio.run(automation_scripts_generation())
+
+
+# Subcommand to execute the test cases
+def run_command(args):
+    require_settings("run", args.deterministic)
+    from test_scripts_execution import run_test_cases
+    run_test_cases(args.shards, args.deterministic, args.per_test_case, args.resume, args.fail_fast)
+
+
+# Subcommand to list the parsed test cases, without calling GPT
+def list_command(args):
+    from test_scripts_generation import prepare_test_cases_offline
+    positive_test_cases, negative_test_cases, unparsed_test_cases = prepare_test_cases_offline()
+
+    print()
+    for category, test_cases in (("positive", positive_test_cases), ("negative", negative_test_cases)):
+        for test_case in test_cases:
+            print(f"{test_case['test']:>4}  {category:<8}  {test_case['name']}  ({len(test_case['steps'])} steps)")
+            if args.steps:
+                for step in test_case["steps"]:
+                    print(f"{'':>16}- {step}")
+    print(f"\n{len(positive_test_cases)} positive and {len(negative_test_cases)} negative test cases.")
+    print_unparsed_test_cases(unparsed_test_cases)
+
+
+# Subcommand to show what a run would do, the test cases, shards, prompts and fallback actions, without starting a browser or calling the language model
+def dry_run_command(args):
+    from test_case_scheduler import TestCaseHistory, order_test_cases, split_test_cases_into_shards, estimate_makespan
+    from test_scripts_generation import prepare_test_cases_offline, generate_browseruse_agent_prompt, generate_test_case_agent_prompt, GENERATED_ACTIONS_MODULE
+    positive_test_cases, negative_test_cases, unparsed_test_cases = prepare_test_cases_offline()
+    test_case_history = TestCaseHistory()
+
+    app_url = os.environ.get("APP_URL", "<APP_URL>")
+    login_account = os.environ.get("LOGIN_ACCOUNT", "<LOGIN_ACCOUNT>")
+
+    # One prompt per test case in the order a run schedules them, or one prompt per shard balanced by the durations of earlier runs
+    prompts = []
+    if args.per_test_case:
+        categories = {test_case["test"]: category for category, test_cases in (("positive", positive_test_cases), ("negative", negative_test_cases)) for test_case in test_cases}
+        test_cases = positive_test_cases + negative_test_cases
+        if args.fail_fast or args.shards > 1:
+            test_cases = order_test_cases(test_cases, test_case_history, args.fail_fast)
+        for test_case in test_cases:
+            title = f"Test case {test_case['test']} ({categories[test_case['test']]}, ~{test_case_history.estimate_duration(test_case['name']):.0f}s, {test_case_history.failure_rate(test_case['name']):.0%} failed)"
+            prompts.append((title, generate_test_case_agent_prompt(app_url, login_account, test_case, categories[test_case["test"]])))
+    else:
+        shards = split_test_cases_into_shards(positive_test_cases, negative_test_cases, max(args.shards, 1), test_case_history, args.fail_fast)
+        for shard_index, (positive_shard, negative_shard) in enumerate(shards):
+            _, _, browseruse_task = generate_browseruse_agent_prompt(app_url, login_account, positive_shard, negative_shard)
+            test_case_numbers = [test_case["test"] for test_case in positive_shard + negative_shard]
+            prompts.append((f"Shard {shard_index} (test cases {test_case_numbers}, ~{estimate_makespan([(positive_shard, negative_shard)], test_case_history):.0f}s)", browseruse_task))
+
+    print("\n----------------RUN PLAN-----------------")
+    for title, prompt in prompts:
+        print(f"{title}: ~{estimate_tokens(prompt)} prompt tokens")
+    print(f"Total: {len(prompts)} agent runs, ~{sum(estimate_tokens(prompt) for _, prompt in prompts)} prompt tokens for their first step.")
+    print_unparsed_test_cases(unparsed_test_cases)
+
+    generated_actions = list_generated_actions(GENERATED_ACTIONS_MODULE)
+    print(f"\n{len(generated_actions)} fallback actions in {GENERATED_ACTIONS_MODULE}:")
+    for action_name, description in generated_actions:
+        print(f"    {action_name}: {description}")
+
+    missing_settings = get_missing_settings("run")
+    if missing_settings:
+        print(f"\nMissing settings for `run`: {', '.join(missing_settings)}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            for title, prompt in prompts:
+                file.write(f"----------------{title}-----------------\n{prompt}\n\n")
+        print(f"\nPrompts saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate, list, dry-run or execute the test cases.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("generate", help="Generate the BrowserUse prompt and the fallback actions from test_cases.txt.")
+
+    run_parser = subparsers.add_parser("run", help="Execute the test cases with BrowserUse and Playwright.")
+    run_parser.add_argument("--shards", type=int, default=1, help="Number of Chrome instances to split the test cases across, balanced by the durations of earlier runs. With --per-test-case, the number of workers.")
+    run_parser.add_argument("--deterministic", action="store_true", help="Run the fallback actions directly, without the BrowserUse agent and language model.")
+    run_parser.add_argument("--per-test-case", action="store_true", help="Run one short-lived BrowserUse agent per test case.")
+    run_parser.add_argument("--resume", action="store_true", help="Skip the test cases an interrupted agent run already completed.")
+    run_parser.add_argument("--fail-fast", action="store_true", help="Run the test cases that failed or were flaky in earlier runs first.")
+
+    list_parser = subparsers.add_parser("list", help="List the parsed test cases, without calling GPT.")
+    list_parser.add_argument("--steps", action="store_true", help="Also list the normalised steps of each test case.")
+
+    dry_run_parser = subparsers.add_parser("dry-run", help="Show the test cases, prompts and fallback actions of a run without executing it.")
+    dry_run_parser.add_argument("--shards", type=int, default=1, help="Number of shards to plan for.")
+    dry_run_parser.add_argument("--per-test-case", action="store_true", help="Plan one agent per test case.")
+    dry_run_parser.add_argument("--fail-fast", action="store_true", help="Plan the test cases that failed or were flaky in earlier runs first.")
+    dry_run_parser.add_argument("--output", help="File to save the full prompts to.")
+
+    args = parser.parse_args()
+
+    # Accessing environment variables from a .env file
+    load_dotenv()
+
+    commands = {"generate": generate_command, "run": run_command, "list": list_command, "dry-run": dry_run_command}
+    commands[args.command](args)
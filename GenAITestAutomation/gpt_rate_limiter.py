@@ -0,0 +1,62 @@
+import os
+import time
+import asyncio
+import collections
+
+
+# Class to schedule GPT requests within the requests-per-minute and tokens-per-minute quota, with a bound on concurrent requests
+class GptRateLimiter:
+    def __init__(self, max_concurrency=4, requests_per_minute=60, tokens_per_minute=80000):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.lock = asyncio.Lock()
+        self.request_log = collections.deque()      # [start time, tokens] of the requests in the last minute
+
+    # Wait for a free slot and enough quota in the sliding one-minute window, returns the log entry of the request
+    async def acquire(self, estimated_tokens):
+        await self.semaphore.acquire()
+        try:
+            async with self.lock:
+                while True:
+                    now = time.monotonic()
+                    while self.request_log and now - self.request_log[0][0] >= 60:
+                        self.request_log.popleft()
+
+                    used_tokens = sum(tokens for _, tokens in self.request_log)
+                    within_request_quota = len(self.request_log) < self.requests_per_minute
+                    within_token_quota = used_tokens + estimated_tokens <= self.tokens_per_minute or not self.request_log
+                    if within_request_quota and within_token_quota:
+                        request_entry = [now, estimated_tokens]
+                        self.request_log.append(request_entry)
+                        return request_entry
+
+                    # Sleep until the oldest request leaves the window
+                    await asyncio.sleep(60 - (now - self.request_log[0][0]))
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    # Record the actual token usage of the request and free its slot
+    def release(self, request_entry, actual_tokens=None):
+        if actual_tokens is not None:
+            request_entry[1] = actual_tokens
+        self.semaphore.release()
+
+
+_rate_limiter = None
+_rate_limiter_loop = None
+
+
+# Function to get the rate limiter shared by all GPT requests of the running event loop, configured from the environment
+def get_gpt_rate_limiter():
+    global _rate_limiter, _rate_limiter_loop
+    loop = asyncio.get_running_loop()
+    if _rate_limiter is None or _rate_limiter_loop is not loop:
+        _rate_limiter = GptRateLimiter(
+            max_concurrency=int(os.environ.get("GPT_MAX_CONCURRENCY") or 4),
+            requests_per_minute=int(os.environ.get("GPT_REQUESTS_PER_MINUTE") or 60),
+            tokens_per_minute=int(os.environ.get("GPT_TOKENS_PER_MINUTE") or 80000)
+        )
+        _rate_limiter_loop = loop
+    return _rate_limiter
@@ -0,0 +1,70 @@
+import os
+import json
+import glob
+import hashlib
+import argparse
+
+
+CACHE_DIRECTORY = ".llm_cache"
+# Least recently used entries beyond this are evicted. Each test case has its own parse and script entries, so this leaves room for about a hundred test cases
+MAX_CACHE_ENTRIES = 256
+
+
+# Function to build a content-addressed cache key from everything that determines the GPT response
+def build_cache_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")              # Separator, so that ("ab", "c") and ("a", "bc") hash differently
+    return digest.hexdigest()
+
+
+# Function to read a cached entry, marking it as recently used for the LRU eviction
+def get_cached_response(cache_key, cache_directory=CACHE_DIRECTORY):
+    cache_path = os.path.join(cache_directory, f"{cache_key}.json")
+    try:
+        with open(cache_path, "r") as file:
+            cache_entry = json.load(file)
+        os.utime(cache_path)
+        return cache_entry
+    except (OSError, ValueError):
+        return None
+
+
+# Function to save an entry to the cache and evict the least recently used entries beyond the limit
+def save_cached_response(cache_key, cache_entry, cache_directory=CACHE_DIRECTORY, max_entries=MAX_CACHE_ENTRIES):
+    os.makedirs(cache_directory, exist_ok=True)
+    cache_path = os.path.join(cache_directory, f"{cache_key}.json")
+
+    # Write to a temporary file first so that an interrupted run never leaves a truncated entry behind
+    with open(f"{cache_path}.tmp", "w") as file:
+        json.dump(cache_entry, file, indent=4)
+    os.replace(f"{cache_path}.tmp", cache_path)
+
+    cache_paths = sorted(glob.glob(os.path.join(cache_directory, "*.json")), key=os.path.getmtime)
+    for stale_path in cache_paths[:-max_entries]:
+        os.remove(stale_path)
+
+
+# Function to remove a single cached entry, or the whole cache when no key is given
+def invalidate_cache(cache_key=None, cache_directory=CACHE_DIRECTORY):
+    pattern = f"{cache_key}.json" if cache_key else "*.json"
+    cache_paths = glob.glob(os.path.join(cache_directory, pattern))
+    for cache_path in cache_paths:
+        os.remove(cache_path)
+    return len(cache_paths)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the cache of GPT responses.")
+    parser.add_argument("command", choices=["list", "invalidate"])
+    parser.add_argument("--key", help="Cache key to invalidate, the whole cache is invalidated if omitted.")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for cache_path in sorted(glob.glob(os.path.join(CACHE_DIRECTORY, "*.json")), key=os.path.getmtime, reverse=True):
+            with open(cache_path, "r") as file:
+                cache_entry = json.load(file)
+            print(f"{os.path.basename(cache_path)[:-5]}  {cache_entry.get('model')}  {cache_entry.get('usage')}")
+    else:
+        print(f"Invalidated {invalidate_cache(args.key)} cached responses.")
@@ -0,0 +1,230 @@
+import os
+import re
+import glob
+import json
+import time
+import argparse
+import importlib.util
+from urllib.parse import urlsplit
+from llm_cache import build_cache_key
+from tracing import tracer
+
+
+REPLAY_SCRIPTS_DIRECTORY = ".replay_scripts"
+
+# Timeout of each replayed Playwright call, a step that does not find its element in time falls back to the agent
+REPLAY_TIMEOUT_MS = 10000
+
+# Header of a compiled replay script, each recorded action becomes one step function taking the Playwright page
+REPLAY_SCRIPT_HEADER = '''# Compiled from the agent run of test case {number}: {name}
+# Recorded on {recorded_at}. Delete this file, or run `python replay_scripts.py invalidate`, to record it again.
+TEST_CASE_NAME = {name!r}
+FINAL_URL = {final_url!r}
+TIMEOUT = {timeout}
+STEPS = {descriptions!r}
+EXPECTED_TEXTS = {expected_texts!r}
+'''
+
+# Status of a replay whose recording has no expected text to check, its steps ran but the expected result was not verified
+UNVERIFIED_REPLAY_STATUS = "Replayed (unverified)"
+
+# Quoted text in the agent's outcome, e.g. the message 'Owner updated successfully', a candidate for the replay to check on the page
+QUOTED_TEXT_PATTERN = re.compile(r"(?<!\w)[\"'“‘]([^\"'”’\n]{3,80})[\"'”’](?!\w)")
+
+# BrowserUse actions that only read the page, they are left out of the replay
+READ_ONLY_ACTIONS = {"extract_content", "get_dropdown_options"}
+
+# BrowserUse actions that switch tabs, the replay drives a single page, so a run that takes them is not recorded.
+# Only an open_tab before any other action is replayed, as a page.goto, since the login prompt opens the application in a new tab
+TAB_ACTIONS = {"open_tab", "switch_tab"}
+
+
+# Function to fingerprint a test case together with what its recorded actions depend on, so that a changed test case or login state is recorded again
+def fingerprint_test_case(test_case, app_url, authenticated):
+    return build_cache_key(json.dumps(test_case, sort_keys=True), app_url, authenticated)
+
+
+# Function to pick the most stable selector of an element the agent interacted with: its id, then the CSS selector, then the XPath
+def get_element_selector(element):
+    if not element:
+        return None
+    element_id = (element.get("attributes") or {}).get("id")
+    if element_id:
+        # Escape the id for the quoted CSS attribute selector, an id with a quote or backslash would otherwise break it
+        escaped_id = element_id.replace("\\", "\\\\").replace('"', '\\"')
+        return f'[id="{escaped_id}"]'
+    if element.get("css_selector"):
+        return element["css_selector"]
+    if element.get("xpath"):
+        return f"xpath=/{element['xpath'].lstrip('/')}"
+    return None
+
+
+# Function to compile one recorded BrowserUse action into a line of Playwright code, returns None for actions that cannot be replayed
+def compile_action(action_name, params, element):
+    selector = get_element_selector(element)
+    if action_name in ("go_to_url", "open_tab"):
+        return f"await page.goto({params['url']!r}, timeout=TIMEOUT)"
+    if action_name == "go_back":
+        return "await page.go_back(timeout=TIMEOUT)"
+    if action_name == "wait":
+        return f"await page.wait_for_timeout({int(params.get('seconds', 3)) * 1000})"
+    if action_name == "click_element_by_index" and selector:
+        return f"await page.click({selector!r}, timeout=TIMEOUT)"
+    if action_name == "input_text" and selector:
+        return f"await page.fill({selector!r}, {params['text']!r}, timeout=TIMEOUT)"
+    if action_name == "select_dropdown_option" and selector:
+        return f"await page.select_option({selector!r}, label={params['text']!r}, timeout=TIMEOUT)"
+    if action_name == "send_keys":
+        return f"await page.keyboard.press({params['keys']!r})"
+    if action_name in ("scroll_down", "scroll_up"):
+        amount = params.get("amount") or 500
+        return f"await page.mouse.wheel(0, {amount if action_name == 'scroll_down' else -amount})"
+    if action_name == "scroll_to_text":
+        return f"await page.get_by_text({params['text']!r}).first.scroll_into_view_if_needed(timeout=TIMEOUT)"
+    return None
+
+
+# Function to collect the texts the agent reported seeing when it checked the expected result, quoted in its outcome details or done text
+def collect_expected_texts(history_steps, outcome_details):
+    reported_texts = list(outcome_details)
+    for step in history_steps:
+        for action in (step.get("model_output") or {}).get("action") or []:
+            if "done" in action:
+                reported_texts.append((action["done"] or {}).get("text") or "")
+    expected_texts = []
+    for reported_text in reported_texts:
+        for expected_text in QUOTED_TEXT_PATTERN.findall(reported_text):
+            if expected_text.strip() and expected_text.strip() not in expected_texts:
+                expected_texts.append(expected_text.strip())
+    return expected_texts
+
+
+# Function to keep the expected texts that are visible on the page the agent ended on, so that the replay only checks what the agent actually saw
+async def find_visible_texts(page, expected_texts):
+    visible_texts = []
+    for expected_text in expected_texts:
+        try:
+            if await page.get_by_text(expected_text).first.is_visible():
+                visible_texts.append(expected_text)
+        except Exception:
+            continue
+    return visible_texts
+
+
+# Function to compile the successful actions of an agent history (as saved by history_store.py) into the source of a replay script,
+# together with the expected texts the replay checks on its last page. Returns the source, or None and the reason when the run took an action that cannot be replayed
+def compile_replay_script(history_steps, test_case, expected_texts=()):
+    descriptions = []
+    step_sources = []
+    final_url = None
+
+    for step in history_steps:
+        final_url = step["state"].get("url") or final_url
+        actions = (step.get("model_output") or {}).get("action") or []
+        elements = step["state"].get("interacted_element") or []
+
+        # BrowserUse stops a step's actions early when the page changes, only the actions with a result were executed
+        for index, (action, result) in enumerate(zip(actions, step.get("result") or [])):
+            action_name, params = next(iter(action.items()))
+            if action_name == "done":
+                break
+            if result.get("error") or action_name in READ_ONLY_ACTIONS:
+                continue
+            if action_name in TAB_ACTIONS and (step_sources or action_name != "open_tab"):
+                return None, f"the run switched tabs with {action_name}, the replay drives a single page"
+
+            code = compile_action(action_name, params or {}, elements[index] if index < len(elements) else None)
+            if not code:
+                return None, f"the {action_name} action cannot be replayed"
+            descriptions.append(f"{action_name} {json.dumps(params)}")
+            step_sources.append(f"async def step_{len(step_sources) + 1}(page):\n    {code}\n")
+
+    if not step_sources:
+        return None, "the run did not record any action"
+
+    header = REPLAY_SCRIPT_HEADER.format(
+        number=test_case["test"],
+        name=test_case["name"],
+        recorded_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+        final_url=final_url,
+        timeout=REPLAY_TIMEOUT_MS,
+        descriptions=descriptions,
+        expected_texts=list(expected_texts)
+    )
+    return header + "\n\n" + "\n\n".join(step_sources), None
+
+
+# Function to save a compiled replay script under the test case fingerprint
+def save_replay_script(fingerprint, script_source, directory=REPLAY_SCRIPTS_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    script_path = os.path.join(directory, f"{fingerprint}.py")
+
+    # Write to a temporary file first so that an interrupted run never leaves a truncated script behind
+    with open(f"{script_path}.tmp", "w") as file:
+        file.write(script_source)
+    os.replace(f"{script_path}.tmp", script_path)
+    return script_path
+
+
+# Function to load the replay script of a test case fingerprint, returns None when none was recorded or it does not load
+def load_replay_script(fingerprint, directory=REPLAY_SCRIPTS_DIRECTORY):
+    script_path = os.path.join(directory, f"{fingerprint}.py")
+    if not os.path.exists(script_path):
+        return None
+
+    spec = importlib.util.spec_from_file_location(f"replay_{fingerprint[:12]}", script_path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        print(f"Failed to load the replay script {script_path}: {e}")
+        return None
+    return module
+
+
+# Function to replay the recorded steps on the page, returns None when all of them ran, the page ended on the recorded URL
+# and shows the expected texts, otherwise a description of what failed
+async def replay_script(replay_module, page):
+    for step_number, description in enumerate(replay_module.STEPS, start=1):
+        try:
+            with tracer.span(f"Replay step {step_number}", "replay_step", action=description):
+                await getattr(replay_module, f"step_{step_number}")(page)
+        except Exception as e:
+            return f"step {step_number} ({description}) failed: {e}"
+
+    # The query and fragment may carry state that differs between runs, only the page itself has to match
+    if replay_module.FINAL_URL and urlsplit(page.url)[:3] != urlsplit(replay_module.FINAL_URL)[:3]:
+        return f"the page ended on {page.url} instead of {replay_module.FINAL_URL}"
+
+    # A regression can leave the page on the same URL, e.g. with a validation error instead of the expected message
+    for expected_text in getattr(replay_module, "EXPECTED_TEXTS", []):
+        try:
+            await page.get_by_text(expected_text).first.wait_for(state="visible", timeout=replay_module.TIMEOUT)
+        except Exception:
+            return f"the expected text '{expected_text}' is not visible on {page.url}"
+    return None
+
+
+# Function to remove a single replay script, or all of them when no fingerprint is given
+def invalidate_replay_scripts(fingerprint=None, directory=REPLAY_SCRIPTS_DIRECTORY):
+    pattern = f"{fingerprint}.py" if fingerprint else "*.py"
+    script_paths = glob.glob(os.path.join(directory, pattern))
+    for script_path in script_paths:
+        os.remove(script_path)
+    return len(script_paths)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the replay scripts compiled from agent runs.")
+    parser.add_argument("command", choices=["list", "invalidate"])
+    parser.add_argument("--fingerprint", help="Fingerprint of the replay script to invalidate, all of them are invalidated if omitted.")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for script_path in sorted(glob.glob(os.path.join(REPLAY_SCRIPTS_DIRECTORY, "*.py")), key=os.path.getmtime, reverse=True):
+            replay_module = load_replay_script(os.path.basename(script_path)[:-3])
+            if replay_module:
+                print(f"{os.path.basename(script_path)[:-3]}  {len(replay_module.STEPS)} steps  {replay_module.TEST_CASE_NAME}")
+    else:
+        print(f"Invalidated {invalidate_replay_scripts(args.fingerprint)} replay scripts.")
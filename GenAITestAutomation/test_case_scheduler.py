@@ -0,0 +1,99 @@
+import os
+import json
+import heapq
+import statistics
+
+
+TEST_CASE_HISTORY_FILE = "test_case_history.json"
+
+# Number of recent runs of a test case its duration estimate and failure rate are based on
+HISTORY_RUNS = 10
+
+# Estimated duration of a test case when no test case has a recorded duration yet
+DEFAULT_DURATION_SECONDS = 60.0
+
+
+# Class to persist the durations and statuses of each test case across runs, keyed by test case name
+class TestCaseHistory:
+    def __init__(self, filename=TEST_CASE_HISTORY_FILE):
+        self.filename = filename
+        self.test_cases = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, "r") as file:
+                    self.test_cases = json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring the unreadable test case history {filename}: {e}")
+
+    # Record the status and, when it was measured on its own, the duration of a test case run, keeping its last runs only
+    def record(self, name, status, duration_seconds=None):
+        runs = self.test_cases.setdefault(name, {"durations": [], "statuses": []})
+        runs["statuses"] = (runs["statuses"] + [status])[-HISTORY_RUNS:]
+        if duration_seconds is not None:
+            runs["durations"] = (runs["durations"] + [round(duration_seconds, 3)])[-HISTORY_RUNS:]
+
+    # Estimated duration of a test case, the median of its recent runs, or the mean estimate of the other test cases when it has none
+    def estimate_duration(self, name):
+        durations = self.test_cases.get(name, {}).get("durations")
+        if durations:
+            return statistics.median(durations)
+        known_estimates = [statistics.median(runs["durations"]) for runs in self.test_cases.values() if runs["durations"]]
+        return statistics.mean(known_estimates) if known_estimates else DEFAULT_DURATION_SECONDS
+
+    # Share of the recent runs of a test case that did not pass, 1.0 for a failing and in between for a flaky test case
+    def failure_rate(self, name):
+        statuses = self.test_cases.get(name, {}).get("statuses")
+        if not statuses:
+            return 0.0
+        return sum(1 for status in statuses if status != "Passed") / len(statuses)
+
+    def save(self):
+        # Write to a temporary file first so that an interrupted run never leaves a truncated history behind
+        with open(f"{self.filename}.tmp", "w") as file:
+            json.dump(self.test_cases, file, indent=4)
+        os.replace(f"{self.filename}.tmp", self.filename)
+
+
+# Function to order the test cases for scheduling: longest estimated duration first, or with fail-fast the historically failing
+# and flaky test cases first (longest first among equals), so that their failures are known early in the run
+def order_test_cases(test_cases, history, fail_fast=False):
+    if fail_fast:
+        return sorted(test_cases, key=lambda test_case: (-history.failure_rate(test_case["name"]), -history.estimate_duration(test_case["name"])))
+    return sorted(test_cases, key=lambda test_case: -history.estimate_duration(test_case["name"]))
+
+
+# Function to split the test cases across shards with the longest-processing-time-first policy: each test case, longest first,
+# goes to the shard with the least estimated work so far. Without any history every estimate is equal and the split is round-robin.
+# Each shard keeps its test cases in file order, or in fail-fast order, within their positive/negative category
+def split_test_cases_into_shards(positive_test_cases, negative_test_cases, num_shards, history=None, fail_fast=False):
+    history = history or TestCaseHistory()
+    categorized_test_cases = [("positive", test_case) for test_case in positive_test_cases]
+    categorized_test_cases += [("negative", test_case) for test_case in negative_test_cases]
+
+    shards = [([], []) for _ in range(num_shards)]
+    shard_loads = [(0.0, shard_index) for shard_index in range(num_shards)]
+    for category, test_case in sorted(categorized_test_cases, key=lambda item: -history.estimate_duration(item[1]["name"])):
+        load, shard_index = heapq.heappop(shard_loads)
+        positive_shard, negative_shard = shards[shard_index]
+        if category == "positive":
+            positive_shard.append(test_case)
+        else:
+            negative_shard.append(test_case)
+        heapq.heappush(shard_loads, (load + history.estimate_duration(test_case["name"]), shard_index))
+
+    # Restore the file order within each shard, or put its historically failing test cases first
+    file_order = {id(test_case): index for index, (_, test_case) in enumerate(categorized_test_cases)}
+    for positive_shard, negative_shard in shards:
+        for shard_test_cases in (positive_shard, negative_shard):
+            if fail_fast:
+                shard_test_cases[:] = order_test_cases(shard_test_cases, history, fail_fast=True)
+            else:
+                shard_test_cases.sort(key=lambda test_case: file_order[id(test_case)])
+
+    # Leave out the empty shards
+    return [(positive_shard, negative_shard) for positive_shard, negative_shard in shards if positive_shard or negative_shard]
+
+
+# Function to estimate the wall time of a schedule, the estimated work of its busiest shard
+def estimate_makespan(shards, history):
+    return max((sum(history.estimate_duration(test_case["name"]) for test_case in positive_shard + negative_shard) for positive_shard, negative_shard in shards), default=0.0)
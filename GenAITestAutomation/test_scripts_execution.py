@@ -1,11 +1,18 @@
 import logging  
 import os
+import re
+import ast
 import json 
+import hashlib
 import asyncio  
-import subprocess  
-import requests  
-import time 
+import argparse
+import shutil
+import tempfile
+import time
+import contextlib
+import importlib.util
 from langchain_openai import AzureChatOpenAI  
+from langchain_core.callbacks import BaseCallbackHandler
 from browser_use import Agent, Controller
 from browser_use.browser.browser import Browser, BrowserConfig
 from browser_use.browser.context import BrowserContext
@@ -14,7 +21,16 @@ from pydantic import BaseModel
 from playwright.async_api import async_playwright
 from typing import List
 from dotenv import load_dotenv
-from test_scripts_generation import extract_test_cases, parse_test_cases_with_prompt, format_test_cases, filter_test_case_steps, generate_browseruse_agent_prompt
+from usage_ledger import usage_ledger, usage_stage, record_usage
+from chrome_launcher import launch_chrome, acquire_pooled_chrome, release_pooled_chrome
+from auth_state import load_auth_state, save_auth_state, apply_auth_state
+from result_stream import result_stream, format_test_case_report_lines
+from history_store import AgentHistoryWriter
+from tracing import tracer, trace_lane
+from chat_cassette import create_chat_model
+from replay_scripts import fingerprint_test_case, collect_expected_texts, find_visible_texts, compile_replay_script, save_replay_script, load_replay_script, replay_script, UNVERIFIED_REPLAY_STATUS
+from test_case_scheduler import TestCaseHistory, order_test_cases, split_test_cases_into_shards, estimate_makespan
+from test_scripts_generation import prepare_test_cases, generate_browseruse_agent_prompt, generate_test_case_agent_prompt
 
 
 # Classes to define the output format of the Agent as a Pydantic model
@@ -32,420 +48,1011 @@ class TestCasesSummary(BaseModel):
 controller = Controller(output_model=TestCasesSummary)
 
 
-# Define Playwright functions for individual test cases (as fallback mechanism)
-#------------------------Copy and paste the functions from the generated text file------------------------
-@controller.action('Login to the application.')
-async def login(browser: BrowserContext):
-    title = "Login Test Case"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
+# Function to record every action the controller executes as a span of the trace, the BrowserUse browser actions and the fallback actions alike
+def trace_controller_actions(controller):
+    execute_action = controller.registry.execute_action
 
-    page = await browser.new_page()
-    actual_outcome_details = []
+    async def execute_traced_action(action_name, params, *args, **kwargs):
+        action = controller.registry.registry.actions.get(action_name)
+        category = "browser_action" if action and action.function.__module__.startswith("browser_use") else "fallback_action"
+        with tracer.span(action_name, category, params=params):
+            return await execute_action(action_name, params, *args, **kwargs)
 
-    try:
-        await page.goto('https://<UI>/')
-        await page.click('text=Log in with SSO')
-        await page.click('text=ak@gmail.com')
-        
-        # Wait for Authenticator approval
-        try:
-            await page.wait_for_selector('your_dashboard_selector', timeout=10000)
-            actual_outcome_status = "Passed"
-        except Exception as e:
-            actual_outcome_details.append(str(e))
-            actual_outcome_status = "Failed"
-            print("Authentication failed, stopping execution.")
-            return ActionResult(
-                extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-                include_in_memory=True
-            )
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+    controller.registry.execute_action = execute_traced_action
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
-    )
 
-@controller.action('Verify Navigation Bar Functionality.')
-async def verify_navigation_bar(browser: BrowserContext):
-    title = "Verify Navigation Bar Functionality"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
+trace_controller_actions(controller)
+
+# Base Chrome remote debugging port, each shard uses the next port up
+CHROME_DEBUG_PORT = 9222
+
+# Module of fallback actions written by the test scripts generation
+GENERATED_ACTIONS_MODULE = "generated_actions.py"
+
+# Outcome reported by the fallback actions in the extracted content of their ActionResult
+ACTION_RESULT_PATTERN = re.compile(
+    r"Title:\s*(?P<title>.*?)\s*\nActual outcome status:\s*(?P<status>.*?)\s*\nActual outcome details:\s*(?P<details>.*)",
+    re.DOTALL
+)
+
+
+# Callback handler to collect the token usage and latency of the agent's language model calls into the usage ledger, and to record each call as a span of the trace
+class UsageLedgerCallbackHandler(BaseCallbackHandler):
+    def __init__(self):
+        self.start_times = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.start_times[run_id] = time.monotonic()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.start_times[run_id] = time.monotonic()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        latency_seconds = time.monotonic() - self.start_times.pop(run_id, time.monotonic())
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+        # Azure reports the usage in the LLM output, newer LangChain versions also attach it to the message
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if not token_usage and response.generations:
+            usage_metadata = getattr(response.generations[0][0].message, "usage_metadata", None) or {}
+            token_usage = {
+                "prompt_tokens": usage_metadata.get("input_tokens", 0),
+                "completion_tokens": usage_metadata.get("output_tokens", 0),
+                "total_tokens": usage_metadata.get("total_tokens", 0)
+            }
 
+        record_usage(
+            token_usage.get("prompt_tokens", 0),
+            token_usage.get("completion_tokens", 0),
+            token_usage.get("total_tokens", 0),
+            latency_seconds
+        )
+        end_time = time.monotonic()
+        tracer.record_span(
+            "LLM call", "llm", end_time - latency_seconds, end_time,
+            prompt_tokens=token_usage.get("prompt_tokens", 0),
+            completion_tokens=token_usage.get("completion_tokens", 0),
+            total_tokens=token_usage.get("total_tokens", 0)
+        )
+
+
+# Function to import the generated fallback actions, which registers them on the controller (its compiled bytecode is reused when up to date)
+def load_generated_actions(filename=GENERATED_ACTIONS_MODULE):
+    if not os.path.exists(filename):
+        print(f"No generated fallback actions found in {filename}, run test_scripts_generation.py to generate them.")
+        return None
+
+    spec = importlib.util.spec_from_file_location("generated_actions", filename)
+    module = importlib.util.module_from_spec(spec)
+    module.controller = controller          # The generated functions are decorated with @controller.action
     try:
-        is_visible = await page.is_visible('your_navigation_bar_selector')
-        if is_visible:
-            links = await page.query_selector_all('your_navigation_links_selector')
-            for link in links:
-                await link.click()
-                # Verify redirection
-                is_correct_page = await page.is_visible('your_correct_page_selector')
-                if not is_correct_page:
-                    actual_outcome_details.append("Redirection failed for one of the links.")
-                    actual_outcome_status = "Failed"
-                    break
-            else:
-                actual_outcome_status = "Passed"
-        else:
-            actual_outcome_details.append("Navigation bar is not visible.")
-            actual_outcome_status = "Failed"
+        spec.loader.exec_module(module)
     except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+        print(f"Failed to load the generated fallback actions from {filename}: {e}")
+        return None
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
-    )
+    print(f"Registered the generated fallback actions from {filename}.")
+    return module
 
-@controller.action('Verify Bulk Modify Button Functionality.')
-async def verify_bulk_modify(browser: BrowserContext):
-    title = "Verify Bulk Modify Button Functionality"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+# Register the generated fallback actions (one per test case) on the controller
+generated_actions = load_generated_actions()
 
+
+# Function to initialize browser and handle setup
+async def initialize_browser(chrome_debug_port=CHROME_DEBUG_PORT, user_data_dir=None):
+    chrome_process = None
     try:
-        await page.click('your_table_row_selector')  # Select multiple rows
-        await page.click('your_bulk_modify_button_selector')
-        await page.select_option('your_owner_status_dropdown_selector', 'new_owner_status')
-        
-        # Verify owner status update
-        is_updated = await page.is_visible('your_updated_owner_status_selector')
-        actual_outcome_status = "Passed" if is_updated else "Failed"
-        if not is_updated:
-            actual_outcome_details.append("Owner status update failed.")
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+        # Specify the path to our Chrome executable
+        chrome_path = os.environ["CHROME_EXECUTABLE_PATH"]
+        user_data_dir = user_data_dir or os.environ["CHROME_USER_DATA_DIRECTORY"]
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
+        # Connect to our existing Chrome installation, start Chrome in debugging mode and wait until it is accessible
+        try:
+            with tracer.span("Chrome launch", "browser_launch", chrome_debug_port=chrome_debug_port) as span_args:
+                chrome_process, launch_latency = await launch_chrome(chrome_path, chrome_debug_port, user_data_dir)
+                span_args["launch_latency_seconds"] = round(launch_latency, 3)
+        except Exception as e:  
+            print(f"Failed to connect to Chrome: {e}") 
+    
+    except Exception as e:  
+        print(f"Failed to initialize the browser: {e}")
+
+    return chrome_path, chrome_debug_port, chrome_process
+
+
+# Function to connect BrowserUse to a running Chrome instance over CDP
+def connect_browser_over_cdp(cdp_url, keep_alive=False):
+    return Browser(
+        config=BrowserConfig(
+            cdp_url=cdp_url,
+            headless=False,
+            disable_security=True,
+            keep_alive=keep_alive      # Keep pooled instances running once the run is over
+        )
     )
 
-@controller.action('Verify Single Row Owner Change.')
-async def verify_single_row_owner_change(browser: BrowserContext):
-    title = "Verify Single Row Owner Change"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+# Function to create the agent's browser context, injecting the saved login session if there is one that has not expired
+async def create_browser_context(browser):
+    browser_context = BrowserContext(browser=browser, config=browser.config.new_context_config)
+    storage_state = load_auth_state()
+    if storage_state:
+        session = await browser_context.get_session()
+        await apply_auth_state(session.context, storage_state)
+    return browser_context, storage_state is not None
 
-    try:
-        await page.click('your_single_row_selector')
-        await page.click('your_owner_column_dropdown_selector')
-        await page.select_option('your_owner_name_selector', 'new_owner_name')
-        
-        # Verify owner update
-        is_updated = await page.is_visible('your_updated_owner_selector')
-        actual_outcome_status = "Passed" if is_updated else "Failed"
-        if not is_updated:
-            actual_outcome_details.append("Owner update failed.")
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
+# Function to save the login session of a run that logged in interactively, once the agent got through its test cases
+async def save_agent_auth_state(browser_context, authenticated, parsed_result):
+    if authenticated or not parsed_result or not browser_context.session:
+        return
+    await save_auth_state(browser_context.session.context)
+
+
+# Function to open the browser for a run, leasing a warm Chrome instance from the browser pool daemon if one is configured
+async def open_browser():
+    pool_address = os.environ.get("BROWSER_POOL_ADDRESS")
+    if pool_address:
+        # Lease a warm, already authenticated Chrome instance from the browser pool daemon
+        lease = await acquire_pooled_chrome(pool_address)
+        return connect_browser_over_cdp(lease["cdp_url"], keep_alive=True), lease
+
+    # Initialize browser and handle setup
+    chrome_path, chrome_debug_port, chrome_process = await initialize_browser()
+
+    # Connect to the browser
+    browser = Browser(
+        config=BrowserConfig(
+            chrome_instance_path=chrome_path,
+            remote_debugging_port=chrome_debug_port,
+            headless=False,
+            disable_security=True
+        )
     )
+    return browser, None
 
-@controller.action('Verify Analyst Assignment.')
-async def verify_analyst_assignment(browser: BrowserContext):
-    title = "Verify Analyst Assignment"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+# Function to initialize the AzureChatOpenAI language model with the provided credentials
+def initialize_llm():
+    # With CHAT_CASSETTE_MODE set, the responses are recorded to or replayed from a cassette, the Azure model is not created for a replay
+    return create_chat_model(lambda: AzureChatOpenAI(
+        model_name=os.environ["AZURE_OPENAI_MODEL"],
+        openai_api_key=os.environ["AZURE_OPENAI_KEY"],
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        deployment_name=os.environ["AZURE_OPENAI_MODEL"],
+        api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        temperature=0,
+        callbacks=[UsageLedgerCallbackHandler()]
+    ))
+
+
+# Function to validate the final result of the agent's run history against the Pydantic output model
+def parse_agent_result(history):
+    result = history.final_result()
+    if not result:
+        return None
+
+    # Convert to JSON string if not already  
+    if not isinstance(result, str):  
+        result = json.dumps(result)
+        print(f"Result: {result}")
+
+    # Validate and parse the JSON result using Pydantic
+    parsed_result: TestCasesSummary = TestCasesSummary.model_validate_json(result)
+    return parsed_result
+
+
+# Function to format the test case results and save them to a text file
+def write_test_case_report(parsed_result, filename="test_case_results.txt"):
+    report_lines = ["## Test Case Results Summary"]
+    # Iterate over each test-case to format and print
+    for test_case in parsed_result.test_cases:
+        report_lines.extend(format_test_case_report_lines(test_case))
+
+    # Print the formatted report  
+    print("\n".join(report_lines))
+
+    # Save the formatted report to a text file
+    with open(f"{filename}", "w") as file:  
+        file.write("\n".join(report_lines))  
+    print(f"Results saved to {filename}")
+
+
+# Function to parse the title, status and details a fallback action reported in its ActionResult
+def parse_action_result(action_result):
+    match = ACTION_RESULT_PATTERN.search(action_result.extracted_content or "")
+    if not match:
+        return None
 
     try:
-        await page.click('your_row_selector')
-        await page.click('your_assign_analyst_button_selector')
-        await page.select_option('your_analyst_dropdown_selector', 'analyst_name')
-        
-        # Verify analyst assignment
-        is_assigned = await page.is_visible('your_assigned_analyst_selector')
-        actual_outcome_status = "Passed" if is_assigned else "Failed"
-        if not is_assigned:
-            actual_outcome_details.append("Analyst assignment failed.")
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+        actual_outcome_details = ast.literal_eval(match["details"].strip())
+    except (ValueError, SyntaxError):
+        actual_outcome_details = [match["details"].strip()]
+    if not isinstance(actual_outcome_details, list):
+        actual_outcome_details = [actual_outcome_details]
+    return match["title"], match["status"], [str(detail) for detail in actual_outcome_details]
+
+
+# Function to get the fallback actions registered on the controller, in the order they are defined (the BrowserUse built-in actions are left out)
+def get_fallback_actions():
+    return [
+        action for action in controller.registry.registry.actions.values()
+        if not action.function.__module__.startswith("browser_use")
+    ]
+
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
+# Function to build the reported test case of a fallback action's outcome, matched to its parsed test case by title for the number, steps and expected result.
+# An outcome that matches none of the test cases, e.g. the login, gets number 0, so that it is never checkpointed in place of a test case of the suite
+def build_test_case(outcome, test_cases, action_description=""):
+    title, actual_outcome_status, actual_outcome_details = outcome
+    names = {title.strip().lower(), action_description.rstrip(".").strip().lower()}
+    test_case = next((test_case for test_case in test_cases if test_case["name"].strip().lower() in names), None)
+    return TestCase(
+        number=test_case["test"] if test_case else 0,
+        title=title,
+        steps=test_case["steps"] if test_case else [action_description],
+        expected_result=test_case["expected_result"] if test_case else "",
+        actual_outcome_status=actual_outcome_status,
+        actual_outcome_details=actual_outcome_details
     )
 
-@controller.action('Verify Navigation Bar with Invalid URL.')
-async def verify_navigation_bar_invalid_url(browser: BrowserContext):
-    title = "Verify Navigation Bar with Invalid URL"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+# Function to build the agent hooks that time each step as a span of the trace, stream the progress of each step and the outcome of every fallback action the step ran,
+# and hand the step to the history writer so that the screenshots and DOM of older steps are left out of the saved history.
+# An agent of a single test case reports its one outcome itself, so it does not stream the outcomes of its fallback actions as well
+def build_agent_step_hooks(test_cases, shard_index=None, history_writer=None, stream_fallback_outcomes=True):
+    step_spans = []
 
-    try:
-        await page.click('your_navigation_link_selector')
-        await page.goto('https://<UI>/invalid-url')
-        
-        # Verify error message or redirection
-        is_error_displayed = await page.is_visible('your_error_message_selector')
-        actual_outcome_status = "Passed" if is_error_displayed else "Failed"
-        if not is_error_displayed:
-            actual_outcome_details.append("Error message or redirection failed.")
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+    async def on_step_start(agent):
+        step_spans.append(tracer.begin(f"Step {agent.state.n_steps}", "agent_step"))
+
+    async def on_step_end(agent):
+        if not agent.state.history.history:
+            return
+        last_step = agent.state.history.history[-1]
+        next_goal = last_step.model_output.current_state.next_goal if last_step.model_output else None
+        result_stream.agent_step(len(agent.state.history.history), next_goal, shard_index)
+
+        if step_spans:
+            action_names = [name for action in (last_step.model_output.action if last_step.model_output else []) for name in action.model_dump(exclude_unset=True)]
+            errors = [action_result.error for action_result in last_step.result if action_result.error]
+            tracer.end(step_spans.pop(), next_goal=next_goal, actions=action_names, errors=errors)
+
+        for action_result in last_step.result if stream_fallback_outcomes else []:
+            outcome = parse_action_result(action_result)
+            if outcome:
+                result_stream.test_case_completed(build_test_case(outcome, test_cases))
+
+        if history_writer:
+            history_writer.add_step(last_step)
+
+    return on_step_start, on_step_end
+
+
+# Function to run the fallback actions one after the other against the browser, without the BrowserUse Agent or a language model
+async def execute_fallback_actions(browser_context, test_cases, authenticated=False, durations=None):
+    login_action = getattr(generated_actions, "LOGIN_ACTION", None)
+    executed_test_cases = []
+
+    for action in get_fallback_actions():
+        if action.name == login_action and authenticated:
+            print("Skipping the login, the browser already carries the saved login session.")
+            continue
+
+        start_time = time.monotonic()
+        try:
+            action_result = await controller.registry.execute_action(action.name, {}, browser=browser_context)
+            outcome = parse_action_result(action_result)
+        except Exception as e:
+            outcome = (action.description.rstrip("."), "Failed", [str(e)])
+        if not outcome:
+            outcome = (action.description.rstrip("."), "Failed", [f"The {action.name} action did not report an outcome."])
+
+        if action.name == login_action:
+            if outcome[1] == "Passed":
+                # Save the login session, so that later runs and parallel shards skip the SSO flow
+                session = await browser_context.get_session()
+                await save_auth_state(session.context)
+                continue
+            # None of the test cases can run without logging in, so report the login failure on its own
+            print("Authentication failed, stopping execution.")
+            login_test_case = build_test_case(outcome, [], action.description)
+            login_test_case.number = 0
+            login_test_case.expected_result = "The dashboard loads after logging in."
+            result_stream.test_case_completed(login_test_case)
+            return TestCasesSummary(test_cases=[login_test_case])
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
+        executed_test_case = build_test_case(outcome, test_cases, action.description)
+        executed_test_cases.append(executed_test_case)
+        result_stream.test_case_completed(executed_test_case)
+        if durations is not None:
+            durations[executed_test_case.number] = time.monotonic() - start_time
+
+    # Test cases without a fallback action cannot be executed deterministically
+    executed_numbers = {test_case.number for test_case in executed_test_cases}
+    for test_case in test_cases:
+        if test_case["test"] not in executed_numbers:
+            executed_test_cases.append(TestCase(
+                number=test_case["test"],
+                title=test_case["name"],
+                steps=test_case["steps"],
+                expected_result=test_case["expected_result"],
+                actual_outcome_status="Skipped",
+                actual_outcome_details=["No fallback action is registered for this test case."]
+            ))
+
+    executed_test_cases.sort(key=lambda test_case: test_case.number)
+    return TestCasesSummary(test_cases=executed_test_cases)
+
+
+# Function to fingerprint the filtered test cases, so that a checkpoint is only resumed for the same suite
+def fingerprint_test_cases(positive_test_cases, negative_test_cases):
+    return hashlib.sha256(json.dumps([positive_test_cases, negative_test_cases], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Function to leave out the test cases an interrupted run of the same suite already completed, returning the remaining test cases and the completed results
+def resume_test_cases(positive_test_cases, negative_test_cases, suite_fingerprint):
+    resumed_test_cases = [TestCase(**test_case) for test_case in result_stream.load_checkpoint(suite_fingerprint)]
+    completed_numbers = {test_case.number for test_case in resumed_test_cases}
+
+    remaining_positive_test_cases = [test_case for test_case in positive_test_cases if test_case["test"] not in completed_numbers]
+    remaining_negative_test_cases = [test_case for test_case in negative_test_cases if test_case["test"] not in completed_numbers]
+    print(f"Resuming from the checkpoint: {len(resumed_test_cases)} test cases already completed, "
+          f"{len(remaining_positive_test_cases) + len(remaining_negative_test_cases)} remaining.")
+
+    return remaining_positive_test_cases, remaining_negative_test_cases, resumed_test_cases
+
+
+# Function to record the statuses, and the durations where they were measured, of the executed test cases in the test case history.
+# Durations are only known for test cases executed on their own, a whole-suite or shard agent only reports their statuses
+def record_test_case_history(history, test_cases, executed_test_cases, durations=None):
+    test_case_names = {test_case["test"]: test_case["name"] for test_case in test_cases}
+    for executed_test_case in executed_test_cases:
+        # An unverified replay neither passed nor failed the test case
+        if executed_test_case.number in test_case_names and executed_test_case.actual_outcome_status not in ("Skipped", UNVERIFIED_REPLAY_STATUS):
+            history.record(test_case_names[executed_test_case.number], executed_test_case.actual_outcome_status, (durations or {}).get(executed_test_case.number))
+    history.save()
+
+
+# Function to clone the Chrome user data directory so that each shard gets its own profile (Chrome locks a profile to one instance)
+def clone_user_data_dir(user_data_dir, shard_index):
+    shard_user_data_dir = os.path.join(tempfile.gettempdir(), f"chrome-shard-{os.getpid()}-{shard_index}")
+    shutil.copytree(
+        user_data_dir,
+        shard_user_data_dir,
+        ignore=shutil.ignore_patterns("Singleton*", "lockfile", "*Cache"),   # Skip lock files and caches Chrome rebuilds on its own
+        dirs_exist_ok=True
     )
+    return shard_user_data_dir
 
-@controller.action('Verify Bulk Modify with No Rows Selected.')
-async def verify_bulk_modify_no_rows(browser: BrowserContext):
-    title = "Verify Bulk Modify with No Rows Selected"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+# Context manager to open the browser of a shard or worker, a Chrome instance leased from the browser pool,
+# or one started on its own debugging port and copy of the user profile, and close it again afterwards
+@contextlib.asynccontextmanager
+async def open_shard_browser(shard_index):
+    chrome_process = None
+    browser = None
+    lease = None
+    user_data_dir = None
 
     try:
-        await page.click('your_bulk_modify_button_selector')
-        
-        # Attempt to change owner status
-        is_error_displayed = await page.is_visible('your_error_message_selector')
-        actual_outcome_status = "Passed" if is_error_displayed else "Failed"
-        if not is_error_displayed:
-            actual_outcome_details.append("Error message not displayed when no rows are selected.")
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+        pool_address = os.environ.get("BROWSER_POOL_ADDRESS")
+        if pool_address:
+            # Lease a warm Chrome instance from the browser pool daemon
+            lease = await acquire_pooled_chrome(pool_address)
+            browser = connect_browser_over_cdp(lease["cdp_url"], keep_alive=True)
+        else:
+            # Initialize the shard's browser on its own debugging port and copy of the user profile
+            user_data_dir = await asyncio.to_thread(clone_user_data_dir, os.environ["CHROME_USER_DATA_DIRECTORY"], shard_index)
+            chrome_path, chrome_debug_port, chrome_process = await initialize_browser(CHROME_DEBUG_PORT + shard_index, user_data_dir)
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
-    )
+            # Connect over CDP, as BrowserUse only probes the default port when given the Chrome executable path
+            browser = connect_browser_over_cdp(f"http://localhost:{chrome_debug_port}")
 
-@controller.action('Verify Single Row Owner Change with Invalid Name.')
-async def verify_single_row_owner_change_invalid_name(browser: BrowserContext):
-    title = "Verify Single Row Owner Change with Invalid Name"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
+        yield browser
+
+    finally:
+        if browser:
+            await browser.close()
+        if chrome_process:
+            chrome_process.terminate()
+        if user_data_dir:
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+        if lease:
+            await release_pooled_chrome(lease)
+        logging.info(f"Shard {shard_index} browser closed successfully.")
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+
+# Function to execute one shard of test cases with its own Chrome instance, debugging port and BrowserUse Agent
+async def execute_test_case_shard(shard_index, positive_test_cases, negative_test_cases, llm, app_url, login_account):
+    browser_context = None
 
     try:
-        await page.click('your_single_row_selector')
-        await page.click('your_owner_column_dropdown_selector')
-        
-        # Attempt to select invalid name
-        is_error_displayed = await page.is_visible('your_error_message_selector')
-        actual_outcome_status = "Passed" if is_error_displayed else "Failed"
-        if not is_error_displayed:
-            actual_outcome_details.append("Error message not displayed for invalid owner name selection.")
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+        async with open_shard_browser(shard_index) as browser:
+            try:
+                # Reuse the saved login session if there is one, and generate the BrowserUse task for the test cases of this shard
+                browser_context, authenticated = await create_browser_context(browser)
+                login_task, test_case_task, browseruse_task = generate_browseruse_agent_prompt(app_url, login_account, positive_test_cases, negative_test_cases, authenticated)
+
+                agent = Agent(
+                    task=browseruse_task, 
+                    llm=llm, 
+                    browser=browser, 
+                    browser_context=browser_context,
+                    controller=controller, 
+                    tool_calling_method="function_calling"
+                )
+
+                # Stream each test case's outcome as soon as the shard's agent finishes it
+                history_writer = AgentHistoryWriter(f"agentResults_shard{shard_index}")
+                on_step_start, on_step_end = build_agent_step_hooks(positive_test_cases + negative_test_cases, shard_index, history_writer)
+
+                print(f"Starting BrowserUse agent run for shard {shard_index}...")
+                with usage_stage("agent", f"Shard {shard_index}"), trace_lane(shard_index + 1, f"Shard {shard_index}"):
+                    history = await agent.run(on_step_start=on_step_start, on_step_end=on_step_end)
+                print(f"BrowserUse agent run completed for shard {shard_index}.")
+
+                # Save the shard's history to its own file
+                history_writer.finish(history)
+
+                parsed_result = parse_agent_result(history)
+                if parsed_result:
+                    for test_case in parsed_result.test_cases:
+                        result_stream.test_case_completed(test_case)
+                else:
+                    print(f"No results to display. The agent for shard {shard_index} did not produce any output.")
+                await save_agent_auth_state(browser_context, authenticated, parsed_result)
+                return parsed_result or build_failed_shard_summary(positive_test_cases + negative_test_cases, "The shard's agent did not report the test case.")
+
+            finally:
+                if browser_context:
+                    await browser_context.close()
+
+    except Exception as e:  
+        print(f"Shard {shard_index} failed to connect to the browser or execute the task: {e}")
+        return build_failed_shard_summary(positive_test_cases + negative_test_cases, f"The shard failed before reporting the test case: {e}")
+
+
+# Function to build the summary of a shard that failed or produced no output: the outcomes it streamed before are kept, and its other test cases
+# fail without being checkpointed, so that they are in the report rather than missing and a resumed run executes them again
+def build_failed_shard_summary(test_cases, details):
+    shard_test_cases = []
+    for test_case in test_cases:
+        reported_test_case = result_stream.reported_test_cases.get(test_case["test"])
+        if not reported_test_case:
+            reported_test_case = build_unexecuted_test_case(test_case, "Failed", [details])
+            result_stream.test_case_completed(reported_test_case, checkpoint=False)
+        shard_test_cases.append(reported_test_case)
+    return TestCasesSummary(test_cases=shard_test_cases)
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
+
+# Function to merge the per-shard results into a single summary ordered by test case number
+def merge_test_case_summaries(shard_results):
+    merged_test_cases = [test_case for shard_result in shard_results if shard_result for test_case in shard_result.test_cases]
+    merged_test_cases.sort(key=lambda test_case: test_case.number)
+    return TestCasesSummary(test_cases=merged_test_cases)
+
+
+# Function to replay the actions recorded by an earlier successful agent run of the test case, returns its passed test case,
+# or None when no actions were recorded or a replayed step failed, in which case the agent executes the test case
+async def replay_test_case(test_case, browser_context, fingerprint):
+    replay_module = load_replay_script(fingerprint)
+    if not replay_module:
+        return None
+
+    print(f"Replaying the {len(replay_module.STEPS)} recorded steps of test case {test_case['test']}: {test_case['name']}...")
+    with tracer.span(f"Test case {test_case['test']}: {test_case['name']}", "test_case", replayed=True) as span_args:
+        try:
+            page = await browser_context.get_current_page()
+            replay_error = await replay_script(replay_module, page)
+        except Exception as e:
+            replay_error = f"the browser page is not available: {e}"
+        span_args["replay_error"] = replay_error
+
+    if replay_error:
+        print(f"Replay of test case {test_case['test']} failed, {replay_error}. Falling back to the BrowserUse agent.")
+        return None
+
+    # Only a replay that found the texts the agent saw on its last page verified the expected result
+    expected_texts = getattr(replay_module, "EXPECTED_TEXTS", [])
+    if expected_texts:
+        actual_outcome_details = [f"Replayed the {len(replay_module.STEPS)} steps recorded by an earlier successful agent run, without the agent, and found the expected texts {expected_texts}."]
+    else:
+        actual_outcome_details = [f"Replayed the {len(replay_module.STEPS)} steps recorded by an earlier successful agent run, without the agent. The recording has no expected text to verify the result with."]
+    return TestCase(
+        number=test_case["test"],
+        title=test_case["name"],
+        steps=test_case["steps"],
+        expected_result=test_case["expected_result"],
+        actual_outcome_status="Passed" if expected_texts else UNVERIFIED_REPLAY_STATUS,
+        actual_outcome_details=actual_outcome_details
     )
 
-@controller.action('Verify Analyst Assignment with No Analyst Selected.')
-async def verify_analyst_assignment_no_analyst(browser: BrowserContext):
-    title = "Verify Analyst Assignment with No Analyst Selected"
-    print(f"Fallback mechanism invoked for {title} task.")
-    print(f"Executing {title} task.")
 
-    page = await browser.get_current_page()
-    actual_outcome_details = []
+# Function to compile the actions of a passed agent run into a replay script, so that the next run of the unchanged test case needs no agent.
+# The texts the agent quoted in its outcome are checked on the page it ended on, and the visible ones become the assertions of the replay
+async def record_replay_script(history, executed_test_case, test_case, fingerprint, browser_context):
+    history_steps = [history_item.model_dump() for history_item in history.history]
+    expected_texts = collect_expected_texts(history_steps, executed_test_case.actual_outcome_details)
+    try:
+        expected_texts = await find_visible_texts(await browser_context.get_current_page(), expected_texts)
+    except Exception:
+        expected_texts = []
+    if not expected_texts:
+        print(f"Test case {test_case['test']} has no visible expected text to check, its replay will be reported as {UNVERIFIED_REPLAY_STATUS}.")
+
+    script_source, reason = compile_replay_script(history_steps, test_case, expected_texts)
+    if not script_source:
+        print(f"Test case {test_case['test']} is not recorded for replay, {reason}.")
+        return
+    script_path = save_replay_script(fingerprint, script_source)
+    print(f"Recorded the actions of test case {test_case['test']} for replay in {script_path}")
+
+
+# Function to execute a single test case with its own short-lived BrowserUse Agent on the shared browser context, so that its history and prompt stay small.
+# A test case with a replay script recorded by an earlier passed run is replayed first, and the agent only runs when the replay fails
+async def execute_test_case_agent(test_case, category, llm, browser, browser_context, app_url, login_account, authenticated):
+    actual_outcome_details = ["The agent did not report an outcome for this test case."]
+    parsed_result = None
+    history = None
+
+    fingerprint = fingerprint_test_case(test_case, app_url, authenticated)
+    replayed_test_case = await replay_test_case(test_case, browser_context, fingerprint)
+    if replayed_test_case:
+        result_stream.test_case_completed(replayed_test_case)
+        return replayed_test_case
 
     try:
-        await page.click('your_row_selector')
-        await page.click('your_assign_analyst_button_selector')
-        
-        # Attempt to save without selecting an analyst
-        is_error_displayed = await page.is_visible('your_error_message_selector')
-        actual_outcome_status = "Passed" if is_error_displayed else "Failed"
-        if not is_error_displayed:
-            actual_outcome_details.append("Error message not displayed for no analyst selection.")
-    except Exception as e:
-        actual_outcome_details.append(str(e))
-        actual_outcome_status = "Failed"
+        test_case_task = generate_test_case_agent_prompt(app_url, login_account, test_case, category, authenticated)
+        agent = Agent(
+            task=test_case_task, 
+            llm=llm, 
+            browser=browser, 
+            browser_context=browser_context,
+            controller=controller, 
+            tool_calling_method="function_calling"
+        )
+
+        print(f"Starting BrowserUse agent run for test case {test_case['test']}: {test_case['name']}...")
+        history_writer = AgentHistoryWriter(f"agentResults_test_case{test_case['test']}")
+        on_step_start, on_step_end = build_agent_step_hooks([test_case], history_writer=history_writer, stream_fallback_outcomes=False)
+        with usage_stage("agent", test_case["name"]), trace_lane(), tracer.span(f"Test case {test_case['test']}: {test_case['name']}", "test_case") as span_args:
+            history = await agent.run(on_step_start=on_step_start, on_step_end=on_step_end)
+            span_args["steps"] = len(history.history)
+
+        # Save the test case's history to its own file
+        history_writer.finish(history)
+        parsed_result = parse_agent_result(history)
+
+    except Exception as e:  
+        # A failing agent only fails its own test case, the next one starts with a fresh agent
+        actual_outcome_details = [f"The agent failed to execute the test case: {e}"]
+
+    if parsed_result and parsed_result.test_cases:
+        executed_test_case = parsed_result.test_cases[0]
+        executed_test_case.number = test_case["test"]
+        if executed_test_case.actual_outcome_status == "Passed":
+            await record_replay_script(history, executed_test_case, test_case, fingerprint, browser_context)
+    else:
+        executed_test_case = TestCase(
+            number=test_case["test"],
+            title=test_case["name"],
+            steps=test_case["steps"],
+            expected_result=test_case["expected_result"],
+            actual_outcome_status="Failed",
+            actual_outcome_details=actual_outcome_details
+        )
+    result_stream.test_case_completed(executed_test_case)
+    return executed_test_case
+
 
-    return ActionResult(
-        extracted_content=f"Title: {title} \nActual outcome status: {actual_outcome_status} \nActual outcome details: {actual_outcome_details}",
-        include_in_memory=True
+# Function to execute a single test case with its agent and measure its duration for the test case history
+async def execute_timed_test_case_agent(test_case, category, llm, browser, browser_context, app_url, login_account, authenticated, durations):
+    start_time = time.monotonic()
+    executed_test_case = await execute_test_case_agent(test_case, category, llm, browser, browser_context, app_url, login_account, authenticated)
+    durations[test_case["test"]] = time.monotonic() - start_time
+    return executed_test_case
+
+
+# Function to build the reported test case of a parsed test case that did not get an outcome of its own, e.g. when its worker's browser failed
+def build_unexecuted_test_case(test_case, actual_outcome_status, actual_outcome_details):
+    return TestCase(
+        number=test_case["test"],
+        title=test_case["name"],
+        steps=test_case["steps"],
+        expected_result=test_case["expected_result"],
+        actual_outcome_status=actual_outcome_status,
+        actual_outcome_details=actual_outcome_details
     )
 
 
-# Function to initialize browser and handle setup
-async def initialize_browser():
+# Function to run a worker of the per test case pool on its own browser: it takes the next test case off the shared queue until
+# the queue is empty, so that the workers stay busy until the end, and the longest test cases, queued first, do not finish last
+async def execute_test_case_worker(worker_index, test_case_queue, llm, app_url, login_account, durations):
+    executed_test_cases = []
+    browser_context = None
+    test_case = None
+
     try:
-        # Specify the path to our Chrome executable
-        chrome_path = os.environ["CHROME_EXECUTABLE_PATH"]
-        user_data_dir = os.environ["CHROME_USER_DATA_DIRECTORY"]
-        chrome_debug_port = 9222  
+        async with open_shard_browser(worker_index) as browser:
+            try:
+                # Reuse the saved login session if there is one, the context stays open across the worker's agents
+                browser_context, authenticated = await create_browser_context(browser)
 
-        # Connect to our existing Chrome installation and start Chrome in debugging mode  
-        subprocess.Popen([chrome_path, f'--remote-debugging-port={chrome_debug_port}', f'--user-data-dir={user_data_dir}'])  
-        time.sleep(5)  # Wait for Chrome to start
+                # The following agents only skip the login once a test case passed on this context, an agent whose login failed leaves it logged out
+                logged_in = authenticated
+                with trace_lane(worker_index + 1, f"Worker {worker_index}"):
+                    while not test_case_queue.empty():
+                        test_case, category = test_case_queue.get_nowait()
+                        executed_test_case = await execute_timed_test_case_agent(
+                            test_case, category, llm, browser, browser_context, app_url, login_account, logged_in, durations
+                        )
+                        executed_test_cases.append(executed_test_case)
+                        test_case = None
+                        logged_in = logged_in or executed_test_case.actual_outcome_status == "Passed"
 
-        try:  
-            response = requests.get(f'http://localhost:{chrome_debug_port}/json/version')  
-            if response.status_code == 200:  
-                print("Chrome is running and accessible.")  
-            else:  
-                print(f"Unexpected status code: {response.status_code}")  
-        except Exception as e:  
-            print(f"Failed to connect to Chrome: {e}") 
-    
-    except Exception as e:  
-        print(f"Failed to initialize the browser: {e}")
+                passed_test_cases = [test_case for test_case in executed_test_cases if test_case.actual_outcome_status == "Passed"]
+                await save_agent_auth_state(browser_context, authenticated, passed_test_cases)
 
-    return chrome_path, chrome_debug_port
+            finally:
+                if browser_context:
+                    await browser_context.close()
+
+    except Exception as e:  
+        # The test cases left in the queue are taken by the other workers, the one the worker was executing fails
+        print(f"Worker {worker_index} failed to connect to the browser or execute its test cases: {e}")
+        if test_case:
+            failed_test_case = build_unexecuted_test_case(test_case, "Failed", [f"The worker's browser failed while executing the test case: {e}"])
+            result_stream.test_case_completed(failed_test_case)
+            executed_test_cases.append(failed_test_case)
+    return executed_test_cases
 
 
 # Function to integrate BrowserUse and Playwright for browser automation and execute defined test cases
-async def execute_test_cases():
+async def execute_test_cases(resume=False, fail_fast=False):
     logging.info('Executing test cases.')
 
     # Accessing environment variables from a .env file
     load_dotenv()
-    azure_openai_api_key = os.environ["AZURE_OPENAI_KEY"]  
-    azure_openai_endpoint = os.environ["AZURE_OPENAI_ENDPOINT"]  
-    azure_openai_api_version = os.environ["AZURE_OPENAI_API_VERSION"]  
-    azure_openai_model = os.environ["AZURE_OPENAI_MODEL"]
     app_url = os.environ["APP_URL"]
     login_account = os.environ["LOGIN_ACCOUNT"]
 
     try:
         # Parse the test cases first
-        test_case_string = extract_test_cases()
+        filtered_positive_test_cases, filtered_negative_test_cases = await prepare_test_cases()
 
-        # Parse the test cases from the input string  
-        test_cases = parse_test_cases_with_prompt(test_case_string)
-        positive_test_cases, negative_test_cases = format_test_cases(test_cases)
+        # Skip the test cases an interrupted run already completed
+        suite_fingerprint = fingerprint_test_cases(filtered_positive_test_cases, filtered_negative_test_cases)
+        resumed_test_cases = []
+        if resume:
+            filtered_positive_test_cases, filtered_negative_test_cases, resumed_test_cases = resume_test_cases(filtered_positive_test_cases, filtered_negative_test_cases, suite_fingerprint)
+            if not filtered_positive_test_cases and not filtered_negative_test_cases:
+                print("All test cases were already completed, nothing to resume.")
+                write_test_case_report(merge_test_case_summaries([TestCasesSummary(test_cases=resumed_test_cases)]))
+                return
 
-        # Filter the steps for positive and negative test cases
-        filtered_positive_test_cases = filter_test_case_steps(positive_test_cases)  
-        filtered_negative_test_cases = filter_test_case_steps(negative_test_cases)
-        print(f"Filtered Positive Test Cases: \n{filtered_positive_test_cases}")
-        print(f"Filtered Negative Test Cases: \n{filtered_negative_test_cases}")
+        # Put the historically failing and flaky test cases first, so that the agent reaches them early
+        test_case_history = TestCaseHistory()
+        if fail_fast:
+            filtered_positive_test_cases = order_test_cases(filtered_positive_test_cases, test_case_history, fail_fast=True)
+            filtered_negative_test_cases = order_test_cases(filtered_negative_test_cases, test_case_history, fail_fast=True)
 
-        # Generate the BrowserUse task using the parsed test cases
-        login_task, test_case_task, browseruse_task = generate_browseruse_agent_prompt(app_url, login_account, filtered_positive_test_cases, filtered_negative_test_cases)
-        
         # Initialize the AzureChatOpenAI language model with the provided credentials
-        llm = AzureChatOpenAI(
-            model_name=azure_openai_model,
-            openai_api_key=azure_openai_api_key,
-            azure_endpoint=azure_openai_endpoint,
-            deployment_name=azure_openai_model,
-            api_version=azure_openai_api_version,
-            temperature=0
-        )
+        llm = initialize_llm()
 
+        browser = None
+        browser_context = None
+        lease = None
         try:
-            # Initialize browser and handle setup
-            chrome_path, chrome_debug_port = await initialize_browser()
-
-            # Connect to the browser
-            browser = Browser(
-                config=BrowserConfig(
-                    chrome_instance_path=chrome_path,
-                    remote_debugging_port=chrome_debug_port,
-                    headless=False,
-                    disable_security=True
-                )
-            )
+            browser, lease = await open_browser()
+
+            # Reuse the saved login session if there is one, and generate the BrowserUse task using the parsed test cases
+            browser_context, authenticated = await create_browser_context(browser)
+            login_task, test_case_task, browseruse_task = generate_browseruse_agent_prompt(app_url, login_account, filtered_positive_test_cases, filtered_negative_test_cases, authenticated)
 
             # Initialize the BrowserUse Agent with the defined task, language model, browser, and controller
             agent = Agent(
                 task=browseruse_task, 
                 llm=llm, 
                 browser=browser, 
+                browser_context=browser_context,
                 controller=controller, 
                 tool_calling_method="function_calling"
             )
 
+            # Stream and checkpoint each test case's outcome as soon as the agent finishes it
+            result_stream.start(suite_fingerprint, resumed_test_cases)
+            history_writer = AgentHistoryWriter("agentResults")
+            on_step_start, on_step_end = build_agent_step_hooks(filtered_positive_test_cases + filtered_negative_test_cases, history_writer=history_writer)
+
             # Run the agent asynchronously and capture the run  
             print("Starting BrowserUse agent run...")
-            history = await agent.run()
+            with usage_stage("agent"), trace_lane():
+                history = await agent.run(on_step_start=on_step_start, on_step_end=on_step_end)
             print("BrowserUse agent run completed.")
 
-            # Save entire history to a file
-            history.save_to_file("agentResults.json")
-
-            # Extract and print the final result from the agent's run history
-            result = history.final_result()
-            if result:  
-                # Convert to JSON string if not already  
-                if not isinstance(result, str):  
-                    result = json.dumps(result)
-                    print(f"Result: {result}")
-
-                # Validate and parse the JSON result using Pydantic
-                parsed_result: TestCasesSummary = TestCasesSummary.model_validate_json(result)  
-                
-                report_lines = ["## Test Case Results Summary"]
-                # Iterate over each test-case to format and print
-                for test_case in parsed_result.test_cases:
-                    report_lines.append(f"\n### Test Case Title: {test_case.title}") 
-                    report_lines.append("- **Steps Executed:**")  
-                    for step in test_case.steps:  
-                        report_lines.append(f"  - {step}")  
-                    report_lines.append(f"- **Expected Result:** \n  - {test_case.expected_result}")  
-                    report_lines.append(f"- **Actual Outcome Status:** \n  - {test_case.actual_outcome_status}")  
-                    report_lines.append("- **Actual Outcome Details:**")
-                    for detail in test_case.actual_outcome_details:  
-                        report_lines.append(f"  - {detail}")
-        
-                # Print the formatted report  
-                print("\n".join(report_lines))
-    
-                # Save the formatted report to a text file
-                filename = "test_case_results.txt"
-                with open(f"{filename}", "w") as file:  
-                    file.write("\n".join(report_lines))  
-                print(f"Results saved to {filename}")
-    
+            # Save the history to a file, with the full payload of the last steps only
+            history_writer.finish(history)
+
+            # Extract the final result from the agent's run history and save the formatted report
+            parsed_result = parse_agent_result(history)
+            if parsed_result and resumed_test_cases:
+                parsed_result = merge_test_case_summaries([TestCasesSummary(test_cases=resumed_test_cases), parsed_result])
+            result_stream.finish(parsed_result)
+            if parsed_result:  
+                write_test_case_report(parsed_result)
+                record_test_case_history(test_case_history, filtered_positive_test_cases + filtered_negative_test_cases, parsed_result.test_cases)
             else:  
                 print('No results to display. The agent did not produce any output.')
-
-            # Close the browser instance
-            await browser.close()
+            await save_agent_auth_state(browser_context, authenticated, parsed_result)
         
         except Exception as e:  
             print(f"Failed to connect to the browser or execute the task: {e}")
 
         finally:
+            if browser_context:
+                await browser_context.close()
             if browser:  
                 await browser.close()
                 logging.info("Browser closed successfully.")
+            if lease:
+                await release_pooled_chrome(lease)
+
+            # Save the token usage of the run per stage next to the test case results
+            usage_ledger.save()
         
     except Exception as e:  
         logging.error(f"An error occurred during test case execution: {e}")
         return {
             "An error occurred during test case execution."   
         }
-    
+
+
+# Function to execute the test cases one at a time, each with its own short-lived BrowserUse Agent sharing the logged-in browser,
+# or with several workers, each on its own browser, taking the test cases longest first as estimated from the earlier runs
+async def execute_test_cases_per_test_case(resume=False, num_workers=1, fail_fast=False):
+    logging.info('Executing test cases with one agent per test case.')
+
+    # Accessing environment variables from a .env file
+    load_dotenv()
+    app_url = os.environ["APP_URL"]
+    login_account = os.environ["LOGIN_ACCOUNT"]
+
+    try:
+        # Parse the test cases first
+        filtered_positive_test_cases, filtered_negative_test_cases = await prepare_test_cases()
+
+        # Skip the test cases an interrupted run already completed
+        suite_fingerprint = fingerprint_test_cases(filtered_positive_test_cases, filtered_negative_test_cases)
+        resumed_test_cases = []
+        if resume:
+            filtered_positive_test_cases, filtered_negative_test_cases, resumed_test_cases = resume_test_cases(filtered_positive_test_cases, filtered_negative_test_cases, suite_fingerprint)
+        test_cases = [(test_case, "Positive") for test_case in filtered_positive_test_cases]
+        test_cases += [(test_case, "Negative") for test_case in filtered_negative_test_cases]
+
+        # Put the historically failing and flaky test cases first, and for a pool of workers the longest test cases first
+        test_case_history = TestCaseHistory()
+        if fail_fast or num_workers > 1:
+            scheduled_test_cases = order_test_cases([test_case for test_case, _ in test_cases], test_case_history, fail_fast)
+            categories = {test_case["test"]: category for test_case, category in test_cases}
+            test_cases = [(test_case, categories[test_case["test"]]) for test_case in scheduled_test_cases]
+        durations = {}
+
+        # Initialize the AzureChatOpenAI language model with the provided credentials
+        llm = initialize_llm()
+
+        if num_workers > 1:
+            test_case_queue = asyncio.Queue()
+            for test_case in test_cases:
+                test_case_queue.put_nowait(test_case)
+            print(f"Executing {len(test_cases)} test cases with {num_workers} workers, estimated at {sum(test_case_history.estimate_duration(test_case['name']) for test_case, _ in test_cases) / num_workers:.0f}s or more.")
+
+            executed_test_cases = []
+            try:
+                result_stream.start(suite_fingerprint, resumed_test_cases)
+                worker_results = await asyncio.gather(*(
+                    execute_test_case_worker(worker_index, test_case_queue, llm, app_url, login_account, durations)
+                    for worker_index in range(min(num_workers, len(test_cases)))
+                ))
+                executed_test_cases = [test_case for worker_result in worker_results for test_case in worker_result]
+
+                # The test cases still queued when every worker failed are reported as skipped, so that the report lists the whole suite
+                while not test_case_queue.empty():
+                    test_case, _ = test_case_queue.get_nowait()
+                    executed_test_cases.append(build_unexecuted_test_case(test_case, "Skipped", ["No worker browser was available to execute the test case."]))
+                print("BrowserUse agent runs completed.")
+
+                parsed_result = merge_test_case_summaries([TestCasesSummary(test_cases=resumed_test_cases + executed_test_cases)])
+                result_stream.finish(parsed_result)
+                if parsed_result.test_cases:
+                    write_test_case_report(parsed_result)
+                else:
+                    print('No results to display. There are no test cases left to execute.')
+
+            finally:
+                # Save the durations for the next schedule, and the token usage of the run per test case next to the test case results
+                record_test_case_history(test_case_history, [test_case for test_case, _ in test_cases], executed_test_cases, durations)
+                usage_ledger.save()
+            return
+
+        browser = None
+        browser_context = None
+        lease = None
+        executed_test_cases = []
+        try:
+            browser, lease = await open_browser()
+
+            # Reuse the saved login session if there is one, the context stays open across the agents
+            browser_context, authenticated = await create_browser_context(browser)
+
+            result_stream.start(suite_fingerprint, resumed_test_cases)
+            # The following agents only skip the login once a test case passed on this context, an agent whose login failed leaves it logged out
+            logged_in = authenticated
+            for test_case, category in test_cases:
+                executed_test_case = await execute_timed_test_case_agent(
+                    test_case, category, llm, browser, browser_context, app_url, login_account, logged_in, durations
+                )
+                executed_test_cases.append(executed_test_case)
+                logged_in = logged_in or executed_test_case.actual_outcome_status == "Passed"
+            print("BrowserUse agent runs completed.")
+
+            parsed_result = merge_test_case_summaries([TestCasesSummary(test_cases=resumed_test_cases + executed_test_cases)])
+            result_stream.finish(parsed_result)
+            if parsed_result.test_cases:
+                write_test_case_report(parsed_result)
+            else:
+                print('No results to display. There are no test cases left to execute.')
+
+            passed_test_cases = [test_case for test_case in executed_test_cases if test_case.actual_outcome_status == "Passed"]
+            await save_agent_auth_state(browser_context, authenticated, passed_test_cases)
+
+        except Exception as e:  
+            print(f"Failed to connect to the browser or execute the task: {e}")
+
+        finally:
+            if browser_context:
+                await browser_context.close()
+            if browser:  
+                await browser.close()
+                logging.info("Browser closed successfully.")
+            if lease:
+                await release_pooled_chrome(lease)
+
+            # Save the durations for the next schedule, and the token usage of the run per test case next to the test case results
+            record_test_case_history(test_case_history, [test_case for test_case, _ in test_cases], executed_test_cases, durations)
+            usage_ledger.save()
+
+    except Exception as e:  
+        logging.error(f"An error occurred during per test case execution: {e}")
+        return {
+            "An error occurred during per test case execution."   
+        }
+
+
+# Function to execute the test cases in parallel shards, each on its own Chrome instance, and merge their results
+async def execute_test_cases_sharded(num_shards, resume=False, fail_fast=False):
+    logging.info(f'Executing test cases across {num_shards} shards.')
+
+    # Accessing environment variables from a .env file
+    load_dotenv()
+    app_url = os.environ["APP_URL"]
+    login_account = os.environ["LOGIN_ACCOUNT"]
+
+    try:
+        # Parse the test cases first and split them across the shards
+        filtered_positive_test_cases, filtered_negative_test_cases = await prepare_test_cases()
+
+        # Skip the test cases an interrupted run already completed
+        suite_fingerprint = fingerprint_test_cases(filtered_positive_test_cases, filtered_negative_test_cases)
+        resumed_test_cases = []
+        if resume:
+            filtered_positive_test_cases, filtered_negative_test_cases, resumed_test_cases = resume_test_cases(filtered_positive_test_cases, filtered_negative_test_cases, suite_fingerprint)
+
+        # Balance the shards by the durations of the earlier runs, longest test case first
+        test_case_history = TestCaseHistory()
+        shards = split_test_cases_into_shards(filtered_positive_test_cases, filtered_negative_test_cases, num_shards, test_case_history, fail_fast)
+        print(f"Split the test cases into {len(shards)} shards, estimated at {estimate_makespan(shards, test_case_history):.0f}s for the longest shard.")
+
+        # The language model client is shared, each shard drives its own browser and agent
+        llm = initialize_llm()
+
+        # Run all shards concurrently, streaming their results as they come in, and merge them into one report
+        result_stream.start(suite_fingerprint, resumed_test_cases)
+        shard_results = await asyncio.gather(*(
+            execute_test_case_shard(shard_index, positive_test_cases, negative_test_cases, llm, app_url, login_account)
+            for shard_index, (positive_test_cases, negative_test_cases) in enumerate(shards)
+        ))
+        parsed_result = merge_test_case_summaries([TestCasesSummary(test_cases=resumed_test_cases)] + shard_results)
+        result_stream.finish(parsed_result)
+
+        if parsed_result.test_cases:
+            write_test_case_report(parsed_result)
+        else:
+            print('No results to display. None of the shards produced any output.')
+        record_test_case_history(test_case_history, filtered_positive_test_cases + filtered_negative_test_cases, parsed_result.test_cases)
+
+    except Exception as e:  
+        logging.error(f"An error occurred during sharded test case execution: {e}")
+        return {
+            "An error occurred during sharded test case execution."   
+        }
+
+    finally:
+        # Save the token usage of the run per stage and shard next to the test case results, also of the calls made before a failure
+        usage_ledger.save()
+
+
+# Function to execute the test cases with their fallback actions only, so that the run needs no language model round-trips
+async def execute_test_cases_deterministic():
+    logging.info('Executing test cases deterministically with the fallback actions.')
+
+    # Accessing environment variables from a .env file
+    load_dotenv()
+
+    try:
+        # Parse the test cases first, they provide the numbers, steps and expected results of the report
+        filtered_positive_test_cases, filtered_negative_test_cases = await prepare_test_cases()
+        test_cases = filtered_positive_test_cases + filtered_negative_test_cases
+
+        browser = None
+        browser_context = None
+        lease = None
+        try:
+            browser, lease = await open_browser()
+            browser_context, authenticated = await create_browser_context(browser)
+
+            print("Starting deterministic run of the fallback actions...")
+            result_stream.start(fingerprint_test_cases(filtered_positive_test_cases, filtered_negative_test_cases))
+            durations = {}
+            parsed_result = await execute_fallback_actions(browser_context, test_cases, authenticated, durations)
+            result_stream.finish(parsed_result)
+            print("Deterministic run completed.")
+
+            write_test_case_report(parsed_result)
+            record_test_case_history(TestCaseHistory(), test_cases, parsed_result.test_cases, durations)
+
+        except Exception as e:  
+            print(f"Failed to connect to the browser or execute the fallback actions: {e}")
+
+        finally:
+            if browser_context:
+                await browser_context.close()
+            if browser:  
+                await browser.close()
+                logging.info("Browser closed successfully.")
+            if lease:
+                await release_pooled_chrome(lease)
+
+    except Exception as e:  
+        logging.error(f"An error occurred during deterministic test case execution: {e}")
+        return {
+            "An error occurred during deterministic test case execution."   
+        }
+
+
+# Function to execute the test cases in the selected mode, used by this script and by `cli.py run`, and save the timing of the run as a trace
+def run_test_cases(shards=1, deterministic=False, per_test_case=False, resume=False, fail_fast=False):
+    try:
+        with tracer.span("Test suite", "suite", shards=shards, deterministic=deterministic, per_test_case=per_test_case, resume=resume, fail_fast=fail_fast):
+            if deterministic:
+                asyncio.run(execute_test_cases_deterministic())
+            elif per_test_case:
+                asyncio.run(execute_test_cases_per_test_case(resume, shards, fail_fast))
+            elif shards > 1:
+                asyncio.run(execute_test_cases_sharded(shards, resume, fail_fast))
+            else:
+                asyncio.run(execute_test_cases(resume, fail_fast))
+    finally:
+        tracer.save("execution_trace.json")
+
+
 if __name__ == "__main__":
-    asyncio.run(execute_test_cases())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Execute the test cases using BrowserUse and Playwright.")
+    parser.add_argument("--shards", type=int, default=1, help="Number of Chrome instances to split the test cases across, balanced by the durations of earlier runs. With --per-test-case, the number of workers.")
+    parser.add_argument("--deterministic", action="store_true", help="Run the fallback actions directly, without the BrowserUse agent and language model.")
+    parser.add_argument("--per-test-case", action="store_true", help="Run one short-lived BrowserUse agent per test case, sharing the logged-in browser, instead of one agent for the whole suite.")
+    parser.add_argument("--resume", action="store_true", help="Skip the test cases an interrupted agent run already completed, as recorded in the checkpoint.")
+    parser.add_argument("--fail-fast", action="store_true", help="Run the test cases that failed or were flaky in earlier runs first.")
+    args = parser.parse_args()
+
+    run_test_cases(args.shards, args.deterministic, args.per_test_case, args.resume, args.fail_fast)
@@ -1,13 +1,26 @@
 import logging  
 import os
+import re
+import ast
 import json 
 import asyncio  
-from OpenAI import callGptEndpoint
+import random
+import time
+import textwrap
+import py_compile
+import functools
 from dotenv import load_dotenv
+from llm_cache import build_cache_key, get_cached_response, save_cached_response
+from gpt_rate_limiter import get_gpt_rate_limiter
+from usage_ledger import usage_ledger, usage_stage, record_usage
+from tracing import tracer
 
   
 # Function to call GPT for the given prompt  
 def generate_gpt_response(prompt):  
+    # Imported on first use, so that listing or dry-running the test cases does not load the OpenAI client
+    from OpenAI import callGptEndpoint
+
     user_message = {  
         "role": "user",  
         "content": prompt  
@@ -21,7 +34,9 @@ def generate_gpt_response(prompt):
         "max_tokens": 4096
     }
   
+    start_time = time.monotonic()
     gpt_response = callGptEndpoint(gpt_options)
+    latency_seconds = time.monotonic() - start_time
 
     if str(gpt_response).startswith("Unexpected"):  
         logging.error("Error occurred while calling GPT endpoint.")  
@@ -33,9 +48,35 @@ def generate_gpt_response(prompt):
     total_tokens = gpt_response.usage.total_tokens
     logging.info("GPT response processed successfully.")
 
+    # Record the token usage and latency against the current stage of the run, and the call as a span of the trace
+    record_usage(prompt_tokens, completion_tokens, total_tokens, latency_seconds)
+    tracer.record_span("GPT call", "llm", start_time, start_time + latency_seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=total_tokens)
+
     return (response, prompt_tokens, completion_tokens, total_tokens)
 
 
+# Function to call GPT asynchronously, so that independent prompts run concurrently within the rate limits
+async def generate_gpt_response_async(prompt, max_retries=3):
+    rate_limiter = get_gpt_rate_limiter()
+    estimated_tokens = len(prompt) // 4 + 4096          # Rough prompt size plus the max_tokens of the completion
+
+    for attempt in range(max_retries + 1):
+        request_entry = await rate_limiter.acquire(estimated_tokens)
+        try:
+            gpt_response = await asyncio.to_thread(generate_gpt_response, prompt)
+            rate_limiter.release(request_entry, gpt_response[3])
+            return gpt_response
+        except Exception as e:
+            rate_limiter.release(request_entry)
+            if attempt == max_retries:
+                raise
+
+            # Exponential backoff with full jitter, so that concurrent retries do not hit the endpoint at the same time
+            delay = random.uniform(0, min(30, 2 ** (attempt + 1)))
+            logging.warning(f"GPT request failed ({e}), retrying in {delay:.1f} seconds.")
+            await asyncio.sleep(delay)
+
+
 # Function to extract test cases
 def extract_test_cases():  
     try:
@@ -59,9 +100,8 @@ def extract_test_cases():
         return None
 
 
-# Function to use GPT and extract relevant sections of test cases from the input string
-def parse_test_cases_with_prompt(input_text):
-    prompt = f"""
+# Prompt template for GPT to extract the test cases, also part of the cache key for the parsed test cases
+PARSE_TEST_CASES_PROMPT = """
     You are given a set of test cases described in a structured format. Extract each test case's name, description, steps, and expected result.
     Organize them into two categories: Positive Test Cases and Negative Test Cases.
     Number each test case sequentially across both categories, starting from 1 for Positive Test Cases and continuing for Negative Test Cases.
@@ -101,7 +141,223 @@ def parse_test_cases_with_prompt(input_text):
         ]  
     }}
     """
-    return generate_gpt_response(prompt)
+
+
+# Function to use GPT and extract relevant sections of test cases from the input string
+def parse_test_cases_with_prompt(input_text):
+    model = os.environ["AZURE_OPENAI_MODEL"]
+
+    # Reuse the parsed test cases if this exact section was already parsed with the same prompt and model
+    cache_key = build_cache_key(input_text, PARSE_TEST_CASES_PROMPT, model)
+    cache_entry = get_cached_response(cache_key)
+    with usage_stage("parse"):
+        if cache_entry:
+            print(f"Using cached parsed test cases ({cache_key[:12]}).")
+            record_usage(0, 0, 0, 0, cached=True)
+            return (cache_entry["response"], 0, 0, 0)
+
+        response, prompt_tokens, completion_tokens, total_tokens = generate_gpt_response(PARSE_TEST_CASES_PROMPT.format(input_text=input_text))
+
+    # Only cache responses that contain valid test case JSON
+    formatted_test_cases = format_test_cases(response)
+    if isinstance(formatted_test_cases, tuple):
+        positive_test_cases, negative_test_cases = formatted_test_cases
+        save_cached_response(cache_key, {
+            "model": model,
+            "response": response,
+            "positive_test_cases": positive_test_cases,
+            "negative_test_cases": negative_test_cases,
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": total_tokens}
+        })
+
+    return (response, prompt_tokens, completion_tokens, total_tokens)
+
+
+# Prompt template for GPT to extract a single test case, used when the test cases are parsed one by one
+PARSE_TEST_CASE_PROMPT = """
+    You are given a single test case described in a structured format. Extract the test case's name, description, steps, and expected result.
+    Format the output in a JSON-like structure for clarity.
+    
+    Input: {input_text}
+    
+    Output:
+    {{
+        "name": "Test Case Name",  
+        "description": "Description",  
+        "steps": [  
+            "Step 1",  
+            "Step 2",  
+            ...  
+        ],  
+        "expected_result": "Expected Result"  
+    }}
+    """
+
+# Start of an individual test case in the test cases section, e.g. "1. **Test Case Name:** ..."
+TEST_CASE_START_PATTERN = re.compile(r"^\s*(\d+)\.\s+\*\*Test Case Name:\*\*")
+
+
+# Function to split the test cases section into individual test cases, along with their Positive/Negative category
+def split_test_cases(test_cases_section):
+    test_cases = []
+    category = None
+    current_test_case = None
+
+    for line in test_cases_section.splitlines():
+        heading = line.strip().lower()
+        if heading.startswith("#"):
+            current_test_case = None
+            if "positive" in heading:
+                category = "Positive Test Cases"
+            elif "negative" in heading:
+                category = "Negative Test Cases"
+        elif TEST_CASE_START_PATTERN.match(line) and category:
+            # Drop the leading number, so that renumbering the test cases does not change their fingerprint
+            current_test_case = [TEST_CASE_START_PATTERN.sub("**Test Case Name:**", line, count=1).strip()]
+            test_cases.append((category, current_test_case))
+        elif current_test_case is not None:
+            current_test_case.append(line.strip())
+
+    return [(category, "\n".join(lines).strip()) for category, lines in test_cases]
+
+
+# Field of an individual test case, e.g. "**Expected Result:** ..."
+TEST_CASE_FIELD_PATTERN = re.compile(r"^\*\*(Test Case Name|Description|Steps|Expected Result):\*\*\s*(.*)$", re.IGNORECASE)
+
+# Step of an individual test case, e.g. "- Open the application URL." or "1. Open the application URL."
+TEST_CASE_STEP_PATTERN = re.compile(r"^(?:[-*+]|\d+[.)])\s+(.*)$")
+
+TEST_CASE_FIELD_KEYS = {"test case name": "name", "description": "description", "steps": "steps", "expected result": "expected_result"}
+
+
+# Function to parse a single test case that follows the structure of test_cases.txt without GPT, returning None if it is free-form
+def parse_test_case_structured(test_case_text):
+    test_case = {"name": "", "description": "", "steps": [], "expected_result": ""}
+    field = None
+
+    for line in test_case_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        match = TEST_CASE_FIELD_PATTERN.match(line)
+        if match:
+            field = TEST_CASE_FIELD_KEYS[match[1].lower()]
+            if field == "steps" and match[2].strip():
+                return None                    # Steps written as prose, GPT has to split them
+            if field != "steps":
+                test_case[field] = match[2].strip()
+        elif field == "steps":
+            step = TEST_CASE_STEP_PATTERN.match(line)
+            if not step:
+                return None
+            test_case["steps"].append(step[1].strip())
+        elif field:
+            # Continuation line of a description or expected result that wraps
+            test_case[field] = f"{test_case[field]} {line}".strip()
+        else:
+            return None
+
+    if not (test_case["name"] and test_case["steps"] and test_case["expected_result"]):
+        return None
+    return test_case
+
+
+# Function to use GPT and extract a single test case, reusing the cached result if the test case text is unchanged.
+# Returns None as the test case when the response holds no valid test case JSON, which is then not cached
+async def parse_test_case_with_prompt(test_case_text, test_case_name):
+    model = os.environ["AZURE_OPENAI_MODEL"]
+
+    cache_key = build_cache_key(test_case_text, PARSE_TEST_CASE_PROMPT, model)
+    cache_entry = get_cached_response(cache_key)
+    with usage_stage("parse", test_case_name):
+        if cache_entry:
+            record_usage(0, 0, 0, 0, cached=True)
+            return cache_entry["test_case"], True
+
+        response, prompt_tokens, completion_tokens, total_tokens = await generate_gpt_response_async(PARSE_TEST_CASE_PROMPT.format(input_text=test_case_text))
+
+    # Extract the JSON object by finding the first and last braces
+    try:
+        test_case = json.loads(response[response.find("{"):response.rfind("}") + 1])
+    except ValueError as e:
+        print(f"Skipping the test case '{test_case_name}', GPT did not return valid test case JSON: {e}")
+        return None, False
+    if not isinstance(test_case, dict):
+        print(f"Skipping the test case '{test_case_name}', GPT did not return a test case JSON object.")
+        return None, False
+
+    save_cached_response(cache_key, {
+        "model": model,
+        "test_case": test_case,
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": total_tokens}
+    })
+    return test_case, False
+
+
+# Function to parse the test cases one by one, so that only new or edited test cases are sent to GPT
+async def parse_test_cases_incrementally(test_cases_section):
+    split_cases = split_test_cases(test_cases_section)
+
+    # Fall back to parsing the whole section at once if it does not follow the expected structure
+    if not split_cases:
+        return format_test_cases(await asyncio.to_thread(parse_test_cases_with_prompt, test_cases_section))
+
+    # Well-formed test cases are parsed locally, only the free-form ones are sent to GPT
+    structured_test_cases = [parse_test_case_structured(test_case_text) for _, test_case_text in split_cases]
+
+    # Parse the new or changed free-form test cases concurrently
+    parsed_test_cases = iter(await asyncio.gather(*(
+        parse_test_case_with_prompt(test_case_text, test_case_text.splitlines()[0].replace("**Test Case Name:**", "").strip())
+        for (_, test_case_text), structured_test_case in zip(split_cases, structured_test_cases) if structured_test_case is None
+    )))
+
+    categorized_test_cases = {"Positive Test Cases": [], "Negative Test Cases": []}
+    local_count = parsed_count = skipped_count = 0
+    for number, ((category, _), structured_test_case) in enumerate(zip(split_cases, structured_test_cases), start=1):
+        if structured_test_case:
+            test_case = structured_test_case
+            local_count += 1
+        else:
+            test_case, cached = next(parsed_test_cases)
+            if test_case is None:
+                skipped_count += 1
+                continue
+            parsed_count += 0 if cached else 1
+        categorized_test_cases[category].append({"test": number, **test_case})
+    print(f"Parsed {local_count} structured test cases locally, {parsed_count} new or changed free-form test cases with GPT, "
+          f"reused {len(split_cases) - local_count - parsed_count - skipped_count} cached test cases, skipped {skipped_count} unparseable test cases.")
+
+    return categorized_test_cases["Positive Test Cases"], categorized_test_cases["Negative Test Cases"]
+
+
+# Function to parse the test cases without GPT, for listing and planning a run: the structured test cases are parsed locally and the free-form ones
+# are taken from the cache. The free-form test cases that are not cached yet are returned apart, as (number, category, name)
+def parse_test_cases_offline(test_cases_section):
+    # The cached responses are keyed on the model, without one nothing can be looked up
+    model = os.environ.get("AZURE_OPENAI_MODEL")
+    split_cases = split_test_cases(test_cases_section)
+
+    # A section that does not follow the expected structure is parsed as a whole
+    if not split_cases:
+        cache_entry = get_cached_response(build_cache_key(test_cases_section, PARSE_TEST_CASES_PROMPT, model)) if model else None
+        if cache_entry:
+            return cache_entry["positive_test_cases"], cache_entry["negative_test_cases"], []
+        return [], [], [(None, None, "All test cases, the section does not follow the expected structure")]
+
+    categorized_test_cases = {"Positive Test Cases": [], "Negative Test Cases": []}
+    unparsed_test_cases = []
+    for number, (category, test_case_text) in enumerate(split_cases, start=1):
+        test_case = parse_test_case_structured(test_case_text)
+        if test_case is None and model:
+            cache_entry = get_cached_response(build_cache_key(test_case_text, PARSE_TEST_CASE_PROMPT, model))
+            test_case = cache_entry["test_case"] if cache_entry else None
+        if test_case is None:
+            unparsed_test_cases.append((number, category, test_case_text.splitlines()[0].replace("**Test Case Name:**", "").strip()))
+            continue
+        categorized_test_cases[category].append({"test": number, **test_case})
+
+    return categorized_test_cases["Positive Test Cases"], categorized_test_cases["Negative Test Cases"], unparsed_test_cases
 
 
 # Function to clean up and extract valid JSON from test cases
@@ -124,38 +380,97 @@ def format_test_cases(response_data):
         # Separate positive and negative test cases  
         positive_test_cases = test_cases_dict.get("Positive Test Cases", [])  
         negative_test_cases = test_cases_dict.get("Negative Test Cases", [])  
-
-        # Convert to pretty-printed JSON strings
-        formatted_positive = json.dumps(positive_test_cases, indent=4)  
-        formatted_negative = json.dumps(negative_test_cases, indent=4)
         
-        return formatted_positive, formatted_negative
+        return positive_test_cases, negative_test_cases
     except Exception as e:  
         return f"An error occurred: {e}"
     
 
+# Rules to normalise the steps of the test cases, as (pattern, replacement) pairs matched against the whole step, case-insensitively.
+# A replacement of None drops the step, e.g. the navigation boilerplate that the login part of the agent prompt already covers
+STEP_NORMALIZATION_RULES = [
+    (r"(open|navigate to|go to|access|launch|visit) (the )?(application|app|web ?site)( url| home ?page)?", None),
+    (r"(log ?in|sign ?in)( to the application)?( (with|using) (valid|the) credentials)?", None),
+    (r"(navigate|go|return) back to the (main )?(dashboard|home ?page)", None),
+    (r"wait for the (page|dashboard|application) to (fully )?load", None),
+]
+
+# Characters that do not change the meaning of a step, ignored when looking for repeated steps
+STEP_KEY_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+# Function to compile the step normalisation rules once, extended by the rules in the JSON file of STEP_NORMALIZATION_RULES_FILE if set
+@functools.lru_cache(maxsize=None)
+def get_step_normalization_rules():
+    rules = list(STEP_NORMALIZATION_RULES)
+    rules_filename = os.environ.get("STEP_NORMALIZATION_RULES_FILE")
+    if rules_filename:
+        with open(rules_filename, "r") as file:
+            rules += [(rule["pattern"], rule.get("replacement")) for rule in json.load(file)]
+
+    # Trailing punctuation is optional in every rule, so that "Open the application URL" and "Open the application URL." both match
+    return [(re.compile(rf"^\s*(?:{pattern})\s*[.!]?\s*$", re.IGNORECASE), replacement) for pattern, replacement in rules]
+
+
+# Function to normalise the steps of a test case: apply the rules, collapse whitespace and drop repeated consecutive steps
+def normalize_test_case_steps(steps):
+    normalized_steps = []
+    previous_step_key = None
+
+    for step in steps:
+        step = " ".join(str(step).split())
+        for pattern, replacement in get_step_normalization_rules():
+            if pattern.match(step):
+                step = None if replacement is None else pattern.sub(replacement, step)
+                break
+        if not step:
+            continue
+
+        step_key = STEP_KEY_PATTERN.sub(" ", step.lower()).strip()
+        if step_key != previous_step_key:
+            normalized_steps.append(step)
+        previous_step_key = step_key
+
+    return normalized_steps
+
+
 # Function to filter out unnecessary steps from test cases  
 def filter_test_case_steps(test_cases):
-    filtered_test_cases = []
-
-    # Convert JSON strings to Python lists  
-    test_cases_list = json.loads(test_cases)
-    
-    # Loop through individual test cases to filter out the step "Open the application URL."
-    for test_case in test_cases_list:
-        # Ensure test_case is treated as a dictionary  
-        if isinstance(test_case, dict):  
-            # Get the 'steps' list and filter it
-            original_steps = test_case.get("steps", [])
-            filtered_steps = [step for step in original_steps if step != "Open the application URL."]
-            test_case["steps"] = filtered_steps  
-            filtered_test_cases.append(test_case)
-
-    # Convert to pretty-printed JSON strings
-    filtered_test_cases = json.dumps(filtered_test_cases, indent=4)
+    filtered_test_cases = [
+        {**test_case, "steps": normalize_test_case_steps(test_case.get("steps", []))}
+        for test_case in test_cases if isinstance(test_case, dict)
+    ]
+
+    removed_steps = sum(len(test_case.get("steps", [])) for test_case in test_cases if isinstance(test_case, dict)) - sum(len(test_case["steps"]) for test_case in filtered_test_cases)
+    if removed_steps:
+        print(f"Removed {removed_steps} boilerplate or repeated steps from {len(filtered_test_cases)} test cases.")
     return filtered_test_cases
 
 
+# Function to extract, parse and filter the test cases to be executed
+async def prepare_test_cases():
+    # Read the test cases from the file
+    test_case_string = extract_test_cases()
+
+    # Parse the test cases from the input string, only new or changed free-form test cases are sent to GPT
+    with tracer.span("Parse test cases", "parse"):
+        positive_test_cases, negative_test_cases = await parse_test_cases_incrementally(test_case_string)
+
+    # Filter the steps for positive and negative test cases
+    filtered_positive_test_cases = filter_test_case_steps(positive_test_cases)  
+    filtered_negative_test_cases = filter_test_case_steps(negative_test_cases)
+    print(f"Filtered Positive Test Cases: \n{json.dumps(filtered_positive_test_cases, indent=4)}")
+    print(f"Filtered Negative Test Cases: \n{json.dumps(filtered_negative_test_cases, indent=4)}")
+
+    return filtered_positive_test_cases, filtered_negative_test_cases
+
+
+# Function to extract, parse and filter the test cases without GPT, also returning the free-form test cases that still need a GPT parse
+def prepare_test_cases_offline():
+    positive_test_cases, negative_test_cases, unparsed_test_cases = parse_test_cases_offline(extract_test_cases() or "")
+    return filter_test_case_steps(positive_test_cases), filter_test_case_steps(negative_test_cases), unparsed_test_cases
+
+
 # Function to extract and format code blocks from GPT response  
 def extract_and_format_code_blocks(response):
     lines = response.split('\n')     # Split the response into lines
@@ -185,7 +500,7 @@ def extract_and_format_code_blocks(response):
 
 
 # Function for GPT prompt to generate BrowserUse task
-def generate_browseruse_agent_prompt(app_url, login_account, positive_test_cases, negative_test_cases):
+def generate_login_prompt(app_url, login_account, authenticated=False):
     # Define the task for the AI agent for accessing the application
     login_prompt = f"""
     1. Execute the **Login Test Case** to access the application:
@@ -198,15 +513,30 @@ def generate_browseruse_agent_prompt(app_url, login_account, positive_test_cases
         - Wait for **up to 10 seconds** for the dashboard to fully load before proceeding.
     """
 
+    # The browser already carries a saved login session, so the SSO flow is only needed if the application still asks for it
+    if authenticated:
+        login_prompt = f"""
+    1. The browser is already logged in to the application:
+        - Open a new tab and navigate to {app_url}.
+        - Wait for the dashboard to fully load before proceeding.
+            - Only if the login page is shown instead, click 'Log in with SSO', select the account {login_account} and wait for Authenticator approval (if prompted).
+    """
+    return login_prompt
+
+
+# Function to generate the prompt of the BrowserUse agent that executes the whole suite in one run
+def generate_browseruse_agent_prompt(app_url, login_account, positive_test_cases, negative_test_cases, authenticated=False):
+    login_prompt = generate_login_prompt(app_url, login_account, authenticated)
+
     # Define the prompt for the AI agent to generate test cases
     test_case_prompt = f"""
     2. After successfully logging in, execute each test case **only ONCE** in the following order:
 
         - First, execute all the **Positive Test Cases** in sequence: 
-        {positive_test_cases}
+        {json.dumps(positive_test_cases, indent=4)}
 
         - Then, execute all the **Negative Test Cases** in sequence: 
-        {negative_test_cases}
+        {json.dumps(negative_test_cases, indent=4)}
     
     3. After executing a test case ONCE, whether it fails or passes:
         - **ALWAYS navigate back to the original dashboard or Home page** before executing the next test case.
@@ -271,10 +601,42 @@ def generate_browseruse_agent_prompt(app_url, login_account, positive_test_cases
     return login_prompt, test_case_prompt, common_task
 
 
-# Function for GPT prompt to generate Playwright script code for individual test cases (as fallback mechanism)
-def generate_playwright_scripts(login_test_case, positive_test_cases, negative_test_cases):
-    # Example Playwright test case script  
-    example_script = """
+# Function to generate the compact prompt of a short-lived BrowserUse agent that executes a single test case
+def generate_test_case_agent_prompt(app_url, login_account, test_case, category, authenticated=False):
+    login_prompt = generate_login_prompt(app_url, login_account, authenticated)
+    test_case_details = json.dumps({key: value for key, value in test_case.items() if key != "test"}, indent=4)
+
+    test_case_task = f"""  
+    **AI Agent Task: UI Testing Automation**  
+    **Objective: Execute a single test case on the application and report its result.**
+    
+    ---  
+
+    {login_prompt}
+    2. After the dashboard has loaded, execute the following {category} Test Case **exactly once**:
+    {test_case_details}
+
+    3. If a step fails, or a button is clicked and its dialog or modal stays open:
+        - Click a Cancel, Close, or Exit button once if visible to exit cleanly,
+        - **Stop immediately and mark the test case as FAILED**.
+
+    4. Check if the actual outcome matches the expected result, then **stop execution completely**.
+        - Report only this test case, with number {test_case["test"]}, its status (Passed/Failed) and details of any failures.
+    
+    ---
+  
+    **IMPORTANT RULES**    
+
+        - **DO NOT retry or reattempt** any step, and **DO NOT loop or retry** actions on page changes, DOM updates, element index changes, or scrolling.
+        - Treat messages like "Something new appeared after action", "Element index changed after action", "Scrolled up the page", or "Scrolled down the page" as **terminal failures**.
+        - DO NOT take any action unless explicitly instructed. Follow the instructions exactly as written.
+    ---
+    """
+    return test_case_task
+
+
+# Example Playwright test case script, used as a template by the script generation prompt
+PLAYWRIGHT_SCRIPT_TEMPLATE = """
     @controller.action('Test Case Description.')
     async def example_func(browser: BrowserContext):
         title = "Test Case Title"
@@ -287,6 +649,11 @@ def generate_playwright_scripts(login_test_case, positive_test_cases, negative_t
         # Insert actions and logic here in proper try-except blocks
         # Example: await page.click('selector')  
         # Example: is_visible = await page.is_visible('selector')  
+        # Check several elements of the same page in one call instead of one is_visible() each
+        # Example: visibility_map = await get_visibility_map(page, ['selector_1', 'selector_2'])
+        # Wait for conditions instead of fixed sleeps
+        # Example: dialog_closed = await wait_for_dialog_closed(page, 'selector')
+        # Example: await wait_for_network_idle(page)
   
         # Determine the actual outcome status based on actions and validations  
         actual_outcome_status = "Passed" if <condition> else "Failed"
@@ -297,37 +664,157 @@ def generate_playwright_scripts(login_test_case, positive_test_cases, negative_t
         )
     """
 
-    # Define the prompt for the AI agent to generate Playwright script
-    prompt = f"""
-    Based on the following structured test cases, generate Playwright automation scripts.
+# Prompt template for GPT to generate the Playwright script of a single test case
+PLAYWRIGHT_SCRIPT_PROMPT = """
+    Based on the following structured test case, generate a Playwright automation script.
     
-    First, execute the login test case to access the application:  
-    {login_test_case}
+    {test_case}
     
-    After successfully logging in, execute the following test cases:
-        - Positive Test Cases: {positive_test_cases}  
-        - Negative Test Cases: {negative_test_cases}
-
-    After executing a test case, always navigate back to the Home page before executing the next test case.
+    Unless this is the login test case, the user is already logged in and on the Home page.
+    After executing the test case, always navigate back to the Home page.
     
-    Use the following template as a guide for structuring the scripts:  
+    Use the following template as a guide for structuring the script:  
     {example_script}
 
-    For each test case (login + positive + negative), generate the corresponding Playwright code snippet.
-    Ensure each snippet includes -
+    Generate the corresponding Playwright code snippet for this test case.
+    Ensure the snippet includes -
     - Actions such as clicking buttons, waiting for elements, and verifying expected outcomes.  
     - Use selectors relevant to the application pages.  
     - Handle exceptions gracefully.
+    - Never wait a fixed time (wait_for_timeout or sleep). Wait for conditions with wait_for_selector, wait_for_dialog_closed(page, selector), wait_for_network_idle(page), wait_for_dom_quiet(page) or wait_for_row_count_change(page, row_selector, previous_count), each returning whether the condition was met.
+    - Use get_visibility_map(page, selectors), which returns a dictionary of selector to visibility, whenever more than one element of the same page is checked for visibility.
       
     Output the code in a Python format suitable for execution in Playwright's async API.
     Replace placeholders like 'your_actual_selector' with real CSS or XPath selectors.
     """
-    
-    return generate_gpt_response(prompt)
+
+
+# Function for GPT prompt to generate the Playwright script of a single test case, reusing the cached script if the test case is unchanged
+async def generate_playwright_script(test_case_text, test_case_name):
+    model = os.environ["AZURE_OPENAI_MODEL"]
+
+    cache_key = build_cache_key(test_case_text, PLAYWRIGHT_SCRIPT_PROMPT, PLAYWRIGHT_SCRIPT_TEMPLATE, model)
+    cache_entry = get_cached_response(cache_key)
+    with usage_stage("script_generation", test_case_name):
+        if cache_entry:
+            record_usage(0, 0, 0, 0, cached=True)
+            return cache_entry["script"], True
+
+        prompt = PLAYWRIGHT_SCRIPT_PROMPT.format(test_case=test_case_text, example_script=PLAYWRIGHT_SCRIPT_TEMPLATE)
+        response, prompt_tokens, completion_tokens, total_tokens = await generate_gpt_response_async(prompt)
+
+    # Extract and format the Playwright automation script code blocks from GPT response
+    script = extract_and_format_code_blocks(response)
+    save_cached_response(cache_key, {
+        "model": model,
+        "script": script,
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": total_tokens}
+    })
+    return script, False
+
+
+# Function to generate Playwright script code for individual test cases (as fallback mechanism), one GPT call per new or changed test case
+async def generate_playwright_scripts(login_test_case, positive_test_cases, negative_test_cases):
+    test_cases = positive_test_cases + negative_test_cases
+    test_case_names = ["Login Test Case"] + [test_case.get("name") for test_case in test_cases]
+
+    # The test case number is left out, so that renumbering does not regenerate the scripts
+    test_case_texts = [login_test_case] + [
+        json.dumps({key: value for key, value in test_case.items() if key != "test"}, indent=4)
+        for test_case in test_cases
+    ]
+
+    # Generate the scripts of the new or changed test cases concurrently
+    generated_scripts = await asyncio.gather(*(
+        generate_playwright_script(test_case_text, test_case_name)
+        for test_case_text, test_case_name in zip(test_case_texts, test_case_names)
+    ))
+    scripts = [script for script, _ in generated_scripts]
+    generated_count = sum(1 for _, cached in generated_scripts if not cached)
+    print(f"Generated {generated_count} new or changed Playwright scripts, reused {len(test_case_texts) - generated_count} cached scripts.")
+
+    return list(zip(test_case_names, scripts))
+
+
+# Module the executor imports the generated fallback actions from
+GENERATED_ACTIONS_MODULE = "generated_actions.py"
+
+# Header of the generated module, the executor injects its controller before the module body runs
+GENERATED_ACTIONS_HEADER = '''# Generated by test_scripts_generation.py from test_cases.txt, regenerate it instead of editing by hand.
+# The executor injects its BrowserUse `controller` into this module before running it.
+import asyncio
+from browser_use.browser.context import BrowserContext
+from browser_use.agent.views import ActionResult
+from page_utils import get_visibility_map, wait_for_dialog_closed, wait_for_network_idle, wait_for_dom_quiet, wait_for_row_count_change
+
+# Fallback action that logs in to the application
+LOGIN_ACTION = {login_action!r}
+'''
+
+
+# Function to check whether a decorator registers the function as a controller action, i.e. @controller.action(...)
+def is_controller_action(decorator):
+    return (
+        isinstance(decorator, ast.Call)
+        and isinstance(decorator.func, ast.Attribute)
+        and decorator.func.attr == "action"
+        and isinstance(decorator.func.value, ast.Name)
+        and decorator.func.value.id == "controller"
+    )
+
+
+# Function to validate the generated scripts and write them as a module the executor imports, along with its compiled bytecode
+def write_generated_actions_module(named_scripts, filename=GENERATED_ACTIONS_MODULE):
+    action_scripts = []
+    function_names = set()
+    login_action = None
+
+    for test_case_name, script in named_scripts:
+        script = textwrap.dedent(script).strip()
+        try:
+            tree = ast.parse(script)
+        except SyntaxError as e:
+            print(f"Skipping the generated script of {test_case_name}, it is not valid Python: {e}")
+            continue
+
+        actions = [
+            node for node in tree.body
+            if isinstance(node, ast.AsyncFunctionDef) and any(is_controller_action(decorator) for decorator in node.decorator_list)
+        ]
+        if not actions:
+            print(f"Skipping the generated script of {test_case_name}, it does not define a @controller.action function.")
+            continue
+
+        # Controller actions are registered by function name, so a reused name would replace an earlier action
+        for action in actions:
+            action_name = action.name
+            suffix = 2
+            while action_name in function_names:
+                action_name = f"{action.name}_{suffix}"
+                suffix += 1
+            if action_name != action.name:
+                script = re.sub(rf"(async\s+def\s+){action.name}\(", rf"\g<1>{action_name}(", script, count=1)
+            function_names.add(action_name)
+            if test_case_name == "Login Test Case" and not login_action:
+                login_action = action_name
+
+        action_scripts.append(script)
+
+    module_source = GENERATED_ACTIONS_HEADER.format(login_action=login_action) + "\n\n" + "\n\n\n".join(action_scripts) + "\n"
+
+    # Write to a temporary file first so that the executor never imports a half written module
+    with open(f"{filename}.tmp", "w") as file:
+        file.write(module_source)
+    os.replace(f"{filename}.tmp", filename)
+
+    # Compile the module to bytecode now, so that the executor imports it from __pycache__ without compiling it at startup
+    py_compile.compile(filename, doraise=True)
+    print(f"Wrote {len(function_names)} fallback actions to {filename}")
+    return len(function_names)
 
 
 # Main function
-def automation_scripts_generation():
+async def automation_scripts_generation():
     logging.info('Generating test scripts.')
 
     # Accessing environment variables from a .env file
@@ -336,18 +823,8 @@ def automation_scripts_generation():
     login_account = os.environ["LOGIN_ACCOUNT"]
 
     try:
-        # Read the test cases from the file
-        test_case_string = extract_test_cases()
-
-        # Parse the test cases from the input string  
-        test_cases = parse_test_cases_with_prompt(test_case_string)
-        positive_test_cases, negative_test_cases = format_test_cases(test_cases)
-
-        # Filter the steps for positive and negative test cases
-        filtered_positive_test_cases = filter_test_case_steps(positive_test_cases)  
-        filtered_negative_test_cases = filter_test_case_steps(negative_test_cases)
-        print(f"Filtered Positive Test Cases: \n{filtered_positive_test_cases}")
-        print(f"Filtered Negative Test Cases: \n{filtered_negative_test_cases}")
+        # Read, parse and filter the test cases
+        filtered_positive_test_cases, filtered_negative_test_cases = await prepare_test_cases()
 
         # Generate the BrowserUse task using the parsed test cases
         login_task, test_case_task, browseruse_task = generate_browseruse_agent_prompt(app_url, login_account, filtered_positive_test_cases, filtered_negative_test_cases)
@@ -360,12 +837,10 @@ def automation_scripts_generation():
         print(f"BrowserUse task appended to {filename}")  
         
         # Generate Playwright script code using the parsed test cases (as fallback mechanism)
-        playwright_scripts = generate_playwright_scripts(login_task, filtered_positive_test_cases, filtered_negative_test_cases)
+        named_scripts = await generate_playwright_scripts(login_task, filtered_positive_test_cases, filtered_negative_test_cases)
 
-        # Extract and format Playwright automation script code blocks from GPT response
-        if isinstance(playwright_scripts, tuple):  
-            playwright_scripts = playwright_scripts[0]
-        playwright_script_code_blocks = extract_and_format_code_blocks(playwright_scripts)
+        # Join individual scripts with newlines to keep each script distinct
+        playwright_script_code_blocks = '\n\n'.join(script for _, script in named_scripts)
         print(f"Playwright Automation scripts: \n\n{playwright_script_code_blocks}")
         
         # Save the playwright scripts to a text file
@@ -374,10 +849,18 @@ def automation_scripts_generation():
             file.write(playwright_script_code_blocks)
         print(f"Playwright Automation scripts appended to {filename}")
 
+        # Save the valid scripts as the module of fallback actions the executor registers at startup
+        write_generated_actions_module(named_scripts)
+
     except Exception as e:  
         print(f"An error occurred during test scripts generation: {e}")
         return {"An error occurred during test scripts generation."}
 
+    finally:
+        # Save the token usage of the generation run per stage and test case, and the timing of its GPT calls, also of the calls made before a failure
+        usage_ledger.save("generation_usage_ledger.json")
+        tracer.save("generation_trace.json")
+
 
 if __name__ == "__main__":  
-    automation_scripts_generation()
\ No newline at end of file
+    asyncio.run(automation_scripts_generation())
\ No newline at end of file
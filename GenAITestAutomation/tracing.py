@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from collections import defaultdict
+
+
+# Lane (Chrome trace thread) the spans are currently recorded on, carried into asyncio tasks and worker threads, so that parallel shards get a lane each.
+# Without a lane, spans go to the lane of their thread, so that concurrent GPT calls in worker threads do not overlap on one lane
+_current_trace_lane = contextvars.ContextVar("trace_lane", default=None)
+
+
+# Function to get the lane the spans are currently recorded on
+def get_trace_lane():
+    return _current_trace_lane.get() or (threading.get_native_id(), threading.current_thread().name)
+
+
+# Class to record nested timing spans of a run (suite, test case, agent step, LLM call, browser and fallback action)
+# and export them as Chrome trace-event JSON, which chrome://tracing and https://ui.perfetto.dev open
+class Tracer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.events = []
+        self.lanes = {}
+
+    # Convert a time.monotonic() value into the microseconds since the tracer started, the unit of the trace events
+    def _timestamp(self, monotonic_time):
+        return round((monotonic_time - self.start_time) * 1_000_000)
+
+    # Record a span that has already been timed, e.g. an LLM call measured by a callback
+    def record_span(self, name, category, start_time, end_time, **args):
+        lane_id, lane_name = get_trace_lane()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._timestamp(start_time),
+            "dur": max(self._timestamp(end_time) - self._timestamp(start_time), 0),
+            "pid": os.getpid(),
+            "tid": lane_id,
+            "args": args
+        }
+        with self.lock:
+            self.lanes[lane_id] = lane_name
+            self.events.append(event)
+
+    # Start a span that is ended by a later, separate call, e.g. an agent step between its start and end hooks
+    def begin(self, name, category, **args):
+        return {"name": name, "category": category, "start_time": time.monotonic(), "args": args}
+
+    # End a span started with begin(), adding the arguments only known at its end
+    def end(self, span, **args):
+        self.record_span(span["name"], span["category"], span["start_time"], time.monotonic(), **span["args"], **args)
+
+    # Context manager to time the code inside it as a span, the yielded dict takes the arguments only known at its end
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        start_time = time.monotonic()
+        try:
+            yield args
+        finally:
+            self.record_span(name, category, start_time, time.monotonic(), **args)
+
+    # Total wall time and number of spans per category, to see at a glance where a run spent its time
+    def summary(self):
+        totals = defaultdict(lambda: {"spans": 0, "seconds": 0.0})
+        with self.lock:
+            for event in self.events:
+                totals[event["cat"]]["spans"] += 1
+                totals[event["cat"]]["seconds"] = round(totals[event["cat"]]["seconds"] + event["dur"] / 1_000_000, 3)
+        return dict(totals)
+
+    def save(self, filename="trace.json"):
+        with self.lock:
+            lane_names = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": lane_id, "args": {"name": lane_name}}
+                for lane_id, lane_name in self.lanes.items()
+            ]
+            trace = {"traceEvents": lane_names + sorted(self.events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}
+        with open(filename, "w") as file:
+            json.dump(trace, file)
+
+        print(f"Trace saved to {filename}, open it in chrome://tracing or https://ui.perfetto.dev")
+        for category, total in sorted(self.summary().items(), key=lambda item: -item[1]["seconds"]):
+            print(f"    {category:<16} {total['spans']:>5} spans  {total['seconds']:>9.3f}s")
+
+
+# Tracer of the current run
+tracer = Tracer()
+
+
+# Context manager to record the spans inside it on their own lane, e.g. one per shard. Without a lane, the current lane is kept
+# for the spans inside it, including those of the LangChain callbacks that run in worker threads
+@contextlib.contextmanager
+def trace_lane(lane_id=None, lane_name=None):
+    token = _current_trace_lane.set((lane_id, lane_name) if lane_id is not None else get_trace_lane())
+    try:
+        yield
+    finally:
+        _current_trace_lane.reset(token)
@@ -0,0 +1,67 @@
+import json
+import threading
+import contextlib
+import contextvars
+from collections import defaultdict
+
+
+# Stage and test case that GPT usage is currently attributed to, carried into asyncio tasks and worker threads
+_current_usage_stage = contextvars.ContextVar("usage_stage", default=("unattributed", None))
+
+
+# Function to create an empty usage record
+def _empty_usage():
+    return {"requests": 0, "cached_requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "latency_seconds": 0.0}
+
+
+# Class to aggregate token usage, request counts and latency of a run per stage and per test case
+class UsageLedger:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = defaultdict(_empty_usage)
+        self.test_cases = defaultdict(lambda: defaultdict(_empty_usage))
+
+    def record(self, stage, test_case, prompt_tokens, completion_tokens, total_tokens, latency_seconds, cached=False):
+        usages = [self.stages[stage], self.stages["total"]]
+        with self.lock:
+            if test_case is not None:
+                usages.append(self.test_cases[test_case][stage])
+            for usage in usages:
+                usage["requests"] += 1
+                usage["cached_requests"] += 1 if cached else 0
+                usage["prompt_tokens"] += prompt_tokens
+                usage["completion_tokens"] += completion_tokens
+                usage["total_tokens"] += total_tokens
+                usage["latency_seconds"] = round(usage["latency_seconds"] + latency_seconds, 3)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "stages": {stage: dict(usage) for stage, usage in self.stages.items()},
+                "test_cases": {test_case: {stage: dict(usage) for stage, usage in stages.items()} for test_case, stages in self.test_cases.items()}
+            }
+
+    def save(self, filename="usage_ledger.json"):
+        with open(filename, "w") as file:
+            json.dump(self.summary(), file, indent=4)
+        print(f"Usage ledger saved to {filename}")
+
+
+# Ledger of the current run
+usage_ledger = UsageLedger()
+
+
+# Context manager to attribute the GPT usage inside it to a stage and, optionally, a test case
+@contextlib.contextmanager
+def usage_stage(stage, test_case=None):
+    token = _current_usage_stage.set((stage, test_case))
+    try:
+        yield
+    finally:
+        _current_usage_stage.reset(token)
+
+
+# Function to record the usage of one GPT request against the current stage
+def record_usage(prompt_tokens, completion_tokens, total_tokens, latency_seconds, cached=False):
+    stage, test_case = _current_usage_stage.get()
+    usage_ledger.record(stage, test_case, prompt_tokens, completion_tokens, total_tokens, latency_seconds, cached)